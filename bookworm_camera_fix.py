@@ -4,11 +4,37 @@ Raspberry Pi OS Bookworm (64-bit) Camera Fix
 Addresses libcamera changes and new camera stack in Bookworm
 """
 
-import cv2
+# cv2 is imported inside the methods that use it - it is slow to import
+# on a Pi and the status checks and PiCamera2 probe do not need it
+import functools
+import re
 import subprocess
 import time
 import os
 import sys
+from pathlib import Path
+
+# Maximum time to wait for a single frame before counting it as lost
+FRAME_TIMEOUT = 0.5
+
+# Non-comment config.txt lines mentioning the camera
+CAMERA_CONFIG_LINE = re.compile(rb'(?m)^[^#\n]*camera[^\n]*', re.IGNORECASE)
+
+# Live-source sink: keep at most one frame queued and drop stale ones so
+# GStreamer buffering never adds latency
+GSTREAMER_SINK = "queue max-size-buffers=1 leaky=downstream ! appsink drop=true max-buffers=1 sync=false"
+
+# Bookworm-specific libcamera pipelines
+GSTREAMER_PIPELINES = [
+    # Basic libcamera pipeline
+    f"libcamerasrc ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! {GSTREAMER_SINK}",
+    
+    # With explicit camera selection
+    f"libcamerasrc camera-name=\"/base/soc/i2c0mux/i2c@1/imx219@10\" ! video/x-raw,width=640,height=480 ! videoconvert ! {GSTREAMER_SINK}",
+    
+    # Lower resolution for memory constraints
+    f"libcamerasrc ! video/x-raw,width=320,height=240,framerate=15/1 ! videoconvert ! {GSTREAMER_SINK}",
+]
 
 class BookwormCameraManager:
     def __init__(self):
@@ -16,12 +42,13 @@ class BookwormCameraManager:
         self.method_used = None
         self.is_bookworm = self._check_bookworm()
     
-    def _check_bookworm(self):
-        """Check if running on Bookworm"""
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _check_bookworm():
+        """Check if running on Bookworm (cached - the OS release cannot change at runtime)"""
         try:
-            with open('/etc/os-release', 'r') as f:
-                content = f.read()
-                return 'bookworm' in content.lower()
+            # read_bytes() sizes its buffer from fstat and reads in one call
+            return b'bookworm' in Path('/etc/os-release').read_bytes().lower()
         except:
             return False
     
@@ -54,33 +81,38 @@ class BookwormCameraManager:
             if os.path.exists(config_file):
                 print(f"   Checking {config_file}:")
                 try:
-                    with open(config_file, 'r') as f:
-                        lines = f.readlines()
-                        camera_related = [line.strip() for line in lines 
-                                        if 'camera' in line.lower() and not line.startswith('#')]
-                        if camera_related:
-                            for line in camera_related:
-                                print(f"     {line}")
-                        else:
-                            print("     No camera settings found")
+                    data = Path(config_file).read_bytes()
+                    camera_related = [m.group(0).decode(errors='replace').strip()
+                                    for m in CAMERA_CONFIG_LINE.finditer(data)]
+                    if camera_related:
+                        for line in camera_related:
+                            print(f"     {line}")
+                    else:
+                        print("     No camera settings found")
                 except Exception as e:
                     print(f"     Error reading config: {e}")
                 break
         
         # Check V4L2 devices
         print("\n3. Checking V4L2 devices:")
-        video_devices = []
-        for i in range(10):
-            device_path = f"/dev/video{i}"
-            if os.path.exists(device_path):
-                video_devices.append(i)
-                print(f"   Found: {device_path}")
+        video_devices = self._list_video_devices()
+        for i in video_devices:
+            print(f"   Found: /dev/video{i}")
         
         if not video_devices:
             print("   No V4L2 devices found")
         
         return len(video_devices) > 0
     
+    @staticmethod
+    def _list_video_devices():
+        """Return sorted V4L2 device numbers using a single /dev scan"""
+        try:
+            return sorted(int(entry.name[5:]) for entry in os.scandir('/dev')
+                          if entry.name.startswith('video') and entry.name[5:].isdigit())
+        except OSError:
+            return []
+    
     def initialize_bookworm_camera(self):
         """Initialize camera using Bookworm-specific methods"""
         print("\n=== BOOKWORM CAMERA INITIALIZATION ===")
@@ -122,7 +154,7 @@ class BookwormCameraManager:
             
             # Start camera
             picam2.start()
-            time.sleep(2)  # Allow camera to stabilize
+            self._wait_for_ae_lock(picam2)  # Allow camera to stabilize
             
             # Capture test frame
             frame = picam2.capture_array()
@@ -146,23 +178,22 @@ class BookwormCameraManager:
             print(f"   PiCamera2 failed: {e}")
             return False
     
+    @staticmethod
+    def _wait_for_ae_lock(picam2, timeout=2.0):
+        """Wait until auto-exposure has converged, or at most `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if picam2.capture_metadata().get("AeLocked"):
+                return True
+        return False
+    
     def _try_libcamera_gstreamer(self):
         """Try libcamera with GStreamer pipeline"""
-        print("Trying: libcamera + GStreamer")
+        import cv2
         
-        # Bookworm-specific libcamera pipelines
-        pipelines = [
-            # Basic libcamera pipeline
-            "libcamerasrc ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! appsink",
-            
-            # With explicit camera selection
-            "libcamerasrc camera-name=\"/base/soc/i2c0mux/i2c@1/imx219@10\" ! video/x-raw,width=640,height=480 ! videoconvert ! appsink",
-            
-            # Lower resolution for memory constraints
-            "libcamerasrc ! video/x-raw,width=320,height=240,framerate=15/1 ! videoconvert ! appsink drop=true max-buffers=1",
-        ]
+        print("Trying: libcamera + GStreamer")
         
-        for i, pipeline in enumerate(pipelines):
+        for i, pipeline in enumerate(GSTREAMER_PIPELINES):
             try:
                 print(f"   Testing pipeline {i+1}...")
                 
@@ -187,9 +218,18 @@ class BookwormCameraManager:
     
     def _try_opencv_direct(self):
         """Try direct OpenCV (might work with USB cameras)"""
+        import cv2
+        
         print("Trying: Direct OpenCV VideoCapture")
         
-        for device_id in range(3):
+        # Only open device indices that actually exist
+        present = set(self._list_video_devices())
+        device_ids = [i for i in range(3) if i in present]
+        if not device_ids:
+            print("   No /dev/video0-2 devices present")
+            return False
+        
+        for device_id in device_ids:
             try:
                 print(f"   Testing device {device_id}...")
                 
@@ -200,6 +240,7 @@ class BookwormCameraManager:
                     self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
                     self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
                     self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    self._set_read_timeout()
                     
                     ret, frame = self.camera.read()
                     if ret and frame is not None:
@@ -219,23 +260,28 @@ class BookwormCameraManager:
     
     def _try_v4l2_bookworm(self):
         """Try V4L2 with Bookworm-specific settings"""
+        import cv2
+        
         print("Trying: V4L2 with Bookworm settings")
         
         try:
-            # First, try to configure V4L2 device
-            v4l2_commands = [
-                # Set format for device 0
-                'v4l2-ctl -d /dev/video0 --set-fmt-video=width=640,height=480,pixelformat=YUYV',
-                
-                # Try device 1 (sometimes Pi camera appears here in Bookworm)
-                'v4l2-ctl -d /dev/video1 --set-fmt-video=width=640,height=480,pixelformat=YUYV',
-            ]
+            # List all V4L2 nodes with a single v4l2-ctl call
+            result = subprocess.run(['v4l2-ctl', '--list-devices'], capture_output=True,
+                                  text=True, timeout=3)
+            # Lowest node first, as the camera is usually /dev/video0
+            listed = sorted({int(n) for n in re.findall(r'/dev/video(\d+)', result.stdout)})
+            if not listed:
+                print("   No V4L2 capture devices listed by v4l2-ctl")
+                return False
             
+            # Configure the first listed device that accepts the format - on
+            # some Bookworm setups the Pi camera appears as /dev/video1
             working_device = None
-            for i, cmd in enumerate(v4l2_commands):
+            for i in listed:
                 try:
-                    result = subprocess.run(cmd.split(), capture_output=True, 
-                                          text=True, timeout=5)
+                    result = subprocess.run(['v4l2-ctl', '-d', f'/dev/video{i}',
+                                           '--set-fmt-video=width=640,height=480,pixelformat=YUYV'],
+                                          capture_output=True, text=True, timeout=5)
                     if result.returncode == 0:
                         working_device = i
                         print(f"   V4L2 configuration successful for /dev/video{i}")
@@ -247,6 +293,7 @@ class BookwormCameraManager:
                 self.camera = cv2.VideoCapture(working_device, cv2.CAP_V4L2)
                 
                 if self.camera.isOpened():
+                    self._set_read_timeout()
                     ret, frame = self.camera.read()
                     if ret and frame is not None:
                         print(f"SUCCESS: V4L2 Bookworm device {working_device} - Frame: {frame.shape}")
@@ -263,9 +310,21 @@ class BookwormCameraManager:
             print(f"   V4L2 Bookworm failed: {e}")
             return False
     
+    def _set_read_timeout(self):
+        """Bound blocking V4L2 reads so a lost frame cannot stall the caller
+        
+        OpenCV does not expose the V4L2 fd for select()/poll(), but its V4L2
+        backend polls the fd internally using this timeout.
+        """
+        import cv2
+        
+        if hasattr(cv2, 'CAP_PROP_READ_TIMEOUT_MSEC'):
+            self.camera.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, FRAME_TIMEOUT * 1000)
+    
     def create_opencv_adapter(self):
         """Create OpenCV adapter for PiCamera2"""
         if self.method_used == "PiCamera2" and hasattr(self, 'picam2_instance'):
+            import cv2
             
             class PiCamera2Adapter:
                 def __init__(self, picam2_instance):
@@ -274,7 +333,8 @@ class BookwormCameraManager:
                 
                 def read(self):
                     try:
-                        frame = self.picam2.capture_array()
+                        # Time out instead of blocking forever on a lost frame
+                        frame = self.picam2.capture_array(wait=FRAME_TIMEOUT)
                         # Convert RGB to BGR for OpenCV compatibility
                         if frame is not None:
                             frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
@@ -320,30 +380,151 @@ class BookwormCameraManager:
         if "PiCamera2" in self.method_used:
             code = '''
 # Bookworm QR Scanner - PiCamera2 Method
-import cv2
-from picamera2 import Picamera2
-from pyzbar import pyzbar
+# cv2, picamera2 and pyzbar are imported where first needed - they are slow
+# to import on a Pi and not every code path uses them
+import math
+import numpy as np
+from ctypes import c_void_p
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
 import time
 
+# Optional: Numba JIT for the finder-pattern pre-filter
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# zbar fourcc for 8-bit grayscale ('Y800')
+ZBAR_Y800 = 808466521
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def find_finder_rows(gray, thresh):
+        """Find QR finder-pattern hints (1:1:3:1:1 dark/light runs) per row
+        
+        Returns an (H, 2) int32 array holding the leftmost and rightmost x of
+        the hits on each row, or -1 where a row has no hit.
+        """
+        height, width = gray.shape
+        hits = np.full((height, 2), -1, np.int32)
+        for y in prange(height):
+            # Run-length encode the row into alternating dark/light runs
+            lengths = np.empty(width, np.int32)
+            starts = np.empty(width, np.int32)
+            darks = np.empty(width, np.bool_)
+            n = 0
+            start = 0
+            dark = gray[y, 0] < thresh
+            for x in range(1, width + 1):
+                if x == width or (gray[y, x] < thresh) != dark:
+                    lengths[n] = x - start
+                    starts[n] = start
+                    darks[n] = dark
+                    n += 1
+                    start = x
+                    if x < width:
+                        dark = not dark
+            
+            # Look for dark-light-dark-light-dark runs in a 1:1:3:1:1 ratio
+            for i in range(n - 4):
+                if not darks[i]:
+                    continue
+                total = lengths[i] + lengths[i + 1] + lengths[i + 2] + lengths[i + 3] + lengths[i + 4]
+                if total < 14:
+                    continue
+                module = total / 7.0
+                tolerance = module / 2.0
+                if (abs(lengths[i] - module) < tolerance
+                        and abs(lengths[i + 1] - module) < tolerance
+                        and abs(lengths[i + 2] - 3 * module) < 3 * tolerance
+                        and abs(lengths[i + 3] - module) < tolerance
+                        and abs(lengths[i + 4] - module) < tolerance):
+                    x1 = starts[i + 4] + lengths[i + 4]
+                    if hits[y, 0] < 0 or starts[i] < hits[y, 0]:
+                        hits[y, 0] = starts[i]
+                    if x1 > hits[y, 1]:
+                        hits[y, 1] = x1
+        return hits
+
 class BookwormQRScanner:
+    # Frames are decoded at half resolution; every Nth frame is decoded at
+    # full resolution so small or distant codes are still detected
+    FULL_RES_EVERY = 5
+    
+    # CPU cores for the capture and decode threads (Pi 4 has cores 0-3)
+    CAPTURE_CPU = 2
+    DECODE_CPU = 3
+    
+    # Padding (pixels) added around the finder-pattern region before decoding
+    ROI_MARGIN = 24
+    
+    # Seconds a cached decode result for an unchanged scene is reused
+    RESULT_CACHE_SECONDS = 1.0
+    
+    # Optional capture rate cap (None = run at the sensor frame rate)
+    TARGET_FPS = None
+    
     def __init__(self):
+        self.logger = self._setup_logging()
         self.picam2 = None
+        # Single-slot mailbox between the capture and decode threads
+        self._frames = queue.Queue(maxsize=1)
+        self._capture_thread = None
+        self._decode_count = 0
+        self._last_signature = None
+        self._last_result = []
+        self._last_result_time = 0.0
+        # Persistent zbar scanner/image, created on first decode
+        self._zbar_scanner = None
+        self._zbar_image = None
+    
+    def _setup_logging(self):
+        """Log through a queue so the capture/decode threads never block on I/O
+        
+        Records are handed to a QueueHandler and written to stdout by a
+        QueueListener thread.
+        """
+        log_queue = queue.Queue(-1)
+        self._log_listener = logging.handlers.QueueListener(
+            log_queue, logging.StreamHandler(sys.stdout), respect_handler_level=True)
+        self._log_listener.start()
+        
+        logger = logging.getLogger(__name__)
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.propagate = False
+        return logger
     
     def initialize_camera(self):
         """Initialize PiCamera2 for Bookworm"""
+        from picamera2 import Picamera2
+        
         try:
             self.picam2 = Picamera2()
             
-            # Configure for QR code scanning
+            # Configure for QR code scanning - YUV420 so the luma (Y) plane
+            # can be handed to pyzbar without any colour conversion.
+            # Two buffers and no frame queue so capture_request() always
+            # blocks for the next fresh frame instead of a stale one.
             config = self.picam2.create_video_configuration({
                 "size": (640, 480),
-                "format": "RGB888"
-            })
+                "format": "YUV420"
+            }, buffer_count=2, queue=False)
             self.picam2.configure(config)
             self.picam2.start()
             
-            # Allow camera to stabilize
-            time.sleep(2)
+            # Allow camera to stabilize - proceed as soon as auto-exposure
+            # has converged (typically well under the 2 s upper bound)
+            deadline = time.monotonic() + 2.0
+            while time.monotonic() < deadline:
+                if self.picam2.capture_metadata().get("AeLocked"):
+                    break
             
             self.logger.info("PiCamera2 initialized successfully")
             
@@ -352,37 +533,201 @@ class BookwormQRScanner:
             raise
     
     def capture_frame(self):
-        """Capture frame from PiCamera2"""
+        """Capture grayscale (Y plane) frame from PiCamera2"""
+        from picamera2 import MappedArray
+        
         try:
-            frame = self.picam2.capture_array()
-            # Convert RGB to BGR for OpenCV
-            if frame is not None:
-                return True, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            return False, None
+            request = self.picam2.capture_request()
+            try:
+                # Copy only the Y plane (first 480 rows) straight out of the
+                # mapped camera buffer; the chroma planes are never touched
+                with MappedArray(request, "main") as mapped:
+                    frame = mapped.array[:480, :640].copy()
+            finally:
+                request.release()
+            return True, frame
         except Exception as e:
             self.logger.error(f"Frame capture failed: {e}")
             return False, None
     
     def decode_qr_codes(self, frame):
-        """Decode QR codes - same as before"""
+        """Decode QR codes from a grayscale frame"""
+        import cv2
+        
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            qr_codes = pyzbar.decode(gray)
+            if frame.ndim == 3:
+                # Colour frame from a non-YUV source: the green channel is a
+                # close enough luma proxy for QR detection and avoids a full
+                # BGR->GRAY conversion pass
+                frame = np.ascontiguousarray(frame[:, :, 1])
+            
+            # Skip pyzbar when the scene is unchanged since the last hit
+            signature = cv2.resize(frame, (16, 16), interpolation=cv2.INTER_AREA).tobytes()
+            now = time.monotonic()
+            if (signature == self._last_signature and self._last_result
+                    and now - self._last_result_time < self.RESULT_CACHE_SECONDS):
+                return self._last_result
+            
+            self._decode_count += 1
+            if self._decode_count % self.FULL_RES_EVERY == 0:
+                qr_codes = self._zbar_decode(frame)
+            else:
+                height, width = frame.shape[:2]
+                small = cv2.resize(frame, (width // 2, height // 2),
+                                   interpolation=cv2.INTER_AREA)
+                if NUMBA_AVAILABLE:
+                    # Only hand zbar the region around finder-pattern hints;
+                    # frames without any hint are skipped until the next
+                    # full-resolution pass
+                    roi = self._finder_roi(small)
+                    if roi is None:
+                        qr_codes = []
+                    else:
+                        x0, y0, x1, y1 = roi
+                        qr_codes = [self._scale_qr_code(qr, 2, (x0, y0))
+                                    for qr in self._zbar_decode(small[y0:y1, x0:x1])]
+                else:
+                    qr_codes = [self._scale_qr_code(qr, 2) for qr in self._zbar_decode(small)]
+            
+            self._last_signature = signature
+            self._last_result = qr_codes
+            self._last_result_time = now
             return qr_codes
         except Exception as e:
             self.logger.error(f"QR decode failed: {e}")
             return []
     
-    def run(self):
-        """Main loop for Bookworm"""
+    def _zbar_decode(self, gray):
+        """Decode a grayscale frame with a persistent zbar scanner and image
+        
+        pyzbar.decode() creates and destroys a scanner and image on every call
+        and copies the pixels with tobytes(); here both are created once and
+        the image is pointed straight at the numpy buffer.
+        """
+        from pyzbar import pyzbar, wrapper as zbar
+        from pyzbar.pyzbar_error import PyZbarError
+        
+        if self._zbar_scanner is None:
+            self._zbar_scanner = zbar.zbar_image_scanner_create()
+            self._zbar_image = zbar.zbar_image_create()
+            if not self._zbar_scanner or not self._zbar_image:
+                raise PyZbarError("Could not create zbar scanner")
+            zbar.zbar_image_set_format(self._zbar_image, ZBAR_Y800)
+        
+        gray = np.ascontiguousarray(gray)
+        height, width = gray.shape
+        zbar.zbar_image_set_size(self._zbar_image, width, height)
+        zbar.zbar_image_set_data(self._zbar_image, gray.ctypes.data_as(c_void_p), gray.size, None)
+        
+        if zbar.zbar_scan_image(self._zbar_scanner, self._zbar_image) < 0:
+            raise PyZbarError("Unsupported image format")
+        
+        # Reuse pyzbar's symbol unpacking so results match pyzbar.decode()
+        return list(pyzbar._decode_symbols(pyzbar._symbols_for_image(self._zbar_image)))
+    
+    def _finder_roi(self, gray):
+        """Bounding box (x0, y0, x1, y1) around finder-pattern hints, or None"""
+        hits = find_finder_rows(gray, int(gray.mean()))
+        rows = np.flatnonzero(hits[:, 0] >= 0)
+        if rows.size == 0:
+            return None
+        
+        height, width = gray.shape
+        margin = self.ROI_MARGIN
+        x0 = max(int(hits[rows, 0].min()) - margin, 0)
+        x1 = min(int(hits[rows, 1].max()) + margin, width)
+        y0 = max(int(rows[0]) - margin, 0)
+        y1 = min(int(rows[-1]) + 1 + margin, height)
+        return x0, y0, x1, y1
+    
+    def _scale_qr_code(self, qr_code, factor, offset=(0, 0)):
+        """Map a QR code decoded on a downsampled frame (or a region of it) back to full-frame coordinates"""
+        from pyzbar.locations import Point, Rect
+        
+        dx, dy = offset
+        left, top, width, height = qr_code.rect
+        rect = Rect((left + dx) * factor, (top + dy) * factor, width * factor, height * factor)
+        polygon = [Point((p.x + dx) * factor, (p.y + dy) * factor) for p in qr_code.polygon]
+        return qr_code._replace(rect=rect, polygon=polygon)
+    
+    def preview_frame(self, frame):
+        """Convert a grayscale frame to BGR for preview display only"""
+        import cv2
+        
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    
+    def _pin_thread(self, cpu, realtime=False):
+        """Pin the calling thread to one CPU and optionally make it SCHED_FIFO
+        
+        SCHED_FIFO needs CAP_SYS_NICE, e.g.:
+            sudo setcap cap_sys_nice+ep $(readlink -f $(which python3))
+        """
+        try:
+            if cpu in os.sched_getaffinity(0):
+                os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            self.logger.warning(f"Could not pin thread to CPU {cpu}: {e}")
+        
+        if realtime:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+            except (AttributeError, OSError) as e:
+                self.logger.warning(f"Could not enable SCHED_FIFO: {e}")
+    
+    def _capture_loop(self):
+        """Capture frames into the mailbox, dropping the oldest if full"""
+        self._pin_thread(self.CAPTURE_CPU, realtime=True)
+        
+        # Deadline-based pacing so capture cadence does not drift with
+        # the time spent capturing each frame
+        period = 1.0 / self.TARGET_FPS if self.TARGET_FPS else None
+        next_deadline = time.monotonic() + period if period else None
+        
         while self.running:
             try:
                 ret, frame = self.capture_frame()
                 if ret:
-                    qr_codes = self.decode_qr_codes(frame)
-                    # Process QR codes as before...
+                    try:
+                        self._frames.put_nowait(frame)
+                    except queue.Full:
+                        try:
+                            self._frames.get_nowait()
+                        except queue.Empty:
+                            pass
+                        self._frames.put_nowait(frame)
+                else:
+                    # Back off while the camera is failing
+                    time.sleep(0.5)
+                
+                if period:
+                    sleep_for = next_deadline - time.monotonic()
+                    if sleep_for > 0:
+                        time.sleep(sleep_for)
+                    else:
+                        # Missed the deadline - skip ahead to resynchronise
+                        self.logger.debug(f"Capture missed deadline by {-sleep_for:.3f}s")
+                        next_deadline += math.ceil(-sleep_for / period) * period
+                    next_deadline += period
                     
-                time.sleep(0.1)
+            except Exception as e:
+                self.logger.error(f"Error in capture loop: {e}")
+                time.sleep(1)
+    
+    def run(self):
+        """Main loop for Bookworm - decodes frames from the capture thread"""
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+        self._pin_thread(self.DECODE_CPU)
+        
+        while self.running:
+            try:
+                try:
+                    frame = self._frames.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                
+                qr_codes = self.decode_qr_codes(frame)
+                # Process QR codes as before...
                 
             except Exception as e:
                 self.logger.error(f"Error in main loop: {e}")
@@ -390,23 +735,28 @@ class BookwormQRScanner:
     
     def cleanup(self):
         """Cleanup PiCamera2"""
+        self.running = False
+        if self._capture_thread:
+            self._capture_thread.join(timeout=2)
         if self.picam2:
             self.picam2.stop()
+        if self._zbar_scanner:
+            from pyzbar import wrapper as zbar
+            
+            zbar.zbar_image_destroy(self._zbar_image)
+            zbar.zbar_image_scanner_destroy(self._zbar_scanner)
+            self._zbar_image = None
+            self._zbar_scanner = None
+        self._log_listener.stop()
 '''
 
         elif "libcamera GStreamer" in self.method_used:
             # Determine which pipeline worked
             pipeline_num = self.method_used.split()[-1]
-            pipelines = [
-                "libcamerasrc ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! appsink",
-                "libcamerasrc camera-name=\"/base/soc/i2c0mux/i2c@1/imx219@10\" ! video/x-raw,width=640,height=480 ! videoconvert ! appsink",
-                "libcamerasrc ! video/x-raw,width=320,height=240,framerate=15/1 ! videoconvert ! appsink drop=true max-buffers=1"
-            ]
-            
             try:
-                pipeline = pipelines[int(pipeline_num) - 1]
+                pipeline = GSTREAMER_PIPELINES[int(pipeline_num) - 1]
             except:
-                pipeline = pipelines[0]
+                pipeline = GSTREAMER_PIPELINES[0]
             
             code = f'''
 # Bookworm QR Scanner - libcamera GStreamer Method
@@ -465,36 +815,44 @@ def initialize_camera(self):
         
         print(f"\nTesting sustained operation for {duration} seconds...")
         
+        # Resolve the read method once instead of on every frame
+        if hasattr(self.camera, 'capture_array'):
+            # PiCamera2 method
+            capture_array = self.camera.capture_array
+            def read_frame():
+                frame = capture_array()
+                return frame is not None, frame
+        else:
+            # OpenCV method
+            read_frame = self.camera.read
+        
         frame_count = 0
         failed_count = 0
         start_time = time.time()
         
         while time.time() - start_time < duration:
             try:
-                if hasattr(self.camera, 'capture_array'):
-                    # PiCamera2 method
-                    frame = self.camera.capture_array()
-                    ret = frame is not None
-                else:
-                    # OpenCV method
-                    ret, frame = self.camera.read()
+                ret, frame = read_frame()
                 
                 if ret:
                     frame_count += 1
                 else:
                     failed_count += 1
                 
-                time.sleep(0.1)
+                # Reads block until the next frame is ready, so the loop
+                # runs at the camera's frame rate without extra sleeps
                 
             except Exception as e:
                 failed_count += 1
                 time.sleep(0.1)
         
-        success_rate = frame_count / (frame_count + failed_count) * 100
+        total = frame_count + failed_count
         print(f"Results: {frame_count} frames captured, {failed_count} failures")
-        print(f"Success rate: {success_rate:.1f}%")
+        if total:
+            print(f"Success rate: {frame_count * 100 / total:.1f}%")
         
-        return success_rate > 90
+        # More than 90% of reads succeeded, compared in integer arithmetic
+        return frame_count * 10 > total * 9
     
     def release(self):
         """Release camera resources"""
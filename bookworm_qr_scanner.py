@@ -1,29 +1,150 @@
 
 # Bookworm QR Scanner - PiCamera2 Method
-import cv2
-from picamera2 import Picamera2
-from pyzbar import pyzbar
+# cv2, picamera2 and pyzbar are imported where first needed - they are slow
+# to import on a Pi and not every code path uses them
+import math
+import numpy as np
+from ctypes import c_void_p
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
 import time
 
+# Optional: Numba JIT for the finder-pattern pre-filter
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# zbar fourcc for 8-bit grayscale ('Y800')
+ZBAR_Y800 = 808466521
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def find_finder_rows(gray, thresh):
+        """Find QR finder-pattern hints (1:1:3:1:1 dark/light runs) per row
+        
+        Returns an (H, 2) int32 array holding the leftmost and rightmost x of
+        the hits on each row, or -1 where a row has no hit.
+        """
+        height, width = gray.shape
+        hits = np.full((height, 2), -1, np.int32)
+        for y in prange(height):
+            # Run-length encode the row into alternating dark/light runs
+            lengths = np.empty(width, np.int32)
+            starts = np.empty(width, np.int32)
+            darks = np.empty(width, np.bool_)
+            n = 0
+            start = 0
+            dark = gray[y, 0] < thresh
+            for x in range(1, width + 1):
+                if x == width or (gray[y, x] < thresh) != dark:
+                    lengths[n] = x - start
+                    starts[n] = start
+                    darks[n] = dark
+                    n += 1
+                    start = x
+                    if x < width:
+                        dark = not dark
+            
+            # Look for dark-light-dark-light-dark runs in a 1:1:3:1:1 ratio
+            for i in range(n - 4):
+                if not darks[i]:
+                    continue
+                total = lengths[i] + lengths[i + 1] + lengths[i + 2] + lengths[i + 3] + lengths[i + 4]
+                if total < 14:
+                    continue
+                module = total / 7.0
+                tolerance = module / 2.0
+                if (abs(lengths[i] - module) < tolerance
+                        and abs(lengths[i + 1] - module) < tolerance
+                        and abs(lengths[i + 2] - 3 * module) < 3 * tolerance
+                        and abs(lengths[i + 3] - module) < tolerance
+                        and abs(lengths[i + 4] - module) < tolerance):
+                    x1 = starts[i + 4] + lengths[i + 4]
+                    if hits[y, 0] < 0 or starts[i] < hits[y, 0]:
+                        hits[y, 0] = starts[i]
+                    if x1 > hits[y, 1]:
+                        hits[y, 1] = x1
+        return hits
+
 class BookwormQRScanner:
+    # Frames are decoded at half resolution; every Nth frame is decoded at
+    # full resolution so small or distant codes are still detected
+    FULL_RES_EVERY = 5
+    
+    # CPU cores for the capture and decode threads (Pi 4 has cores 0-3)
+    CAPTURE_CPU = 2
+    DECODE_CPU = 3
+    
+    # Padding (pixels) added around the finder-pattern region before decoding
+    ROI_MARGIN = 24
+    
+    # Seconds a cached decode result for an unchanged scene is reused
+    RESULT_CACHE_SECONDS = 1.0
+    
+    # Optional capture rate cap (None = run at the sensor frame rate)
+    TARGET_FPS = None
+    
     def __init__(self):
+        self.logger = self._setup_logging()
         self.picam2 = None
+        # Single-slot mailbox between the capture and decode threads
+        self._frames = queue.Queue(maxsize=1)
+        self._capture_thread = None
+        self._decode_count = 0
+        self._last_signature = None
+        self._last_result = []
+        self._last_result_time = 0.0
+        # Persistent zbar scanner/image, created on first decode
+        self._zbar_scanner = None
+        self._zbar_image = None
+    
+    def _setup_logging(self):
+        """Log through a queue so the capture/decode threads never block on I/O
+        
+        Records are handed to a QueueHandler and written to stdout by a
+        QueueListener thread.
+        """
+        log_queue = queue.Queue(-1)
+        self._log_listener = logging.handlers.QueueListener(
+            log_queue, logging.StreamHandler(sys.stdout), respect_handler_level=True)
+        self._log_listener.start()
+        
+        logger = logging.getLogger(__name__)
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.propagate = False
+        return logger
     
     def initialize_camera(self):
         """Initialize PiCamera2 for Bookworm"""
+        from picamera2 import Picamera2
+        
         try:
             self.picam2 = Picamera2()
             
-            # Configure for QR code scanning
+            # Configure for QR code scanning - YUV420 so the luma (Y) plane
+            # can be handed to pyzbar without any colour conversion.
+            # Two buffers and no frame queue so capture_request() always
+            # blocks for the next fresh frame instead of a stale one.
             config = self.picam2.create_video_configuration({
                 "size": (640, 480),
-                "format": "RGB888"
-            })
+                "format": "YUV420"
+            }, buffer_count=2, queue=False)
             self.picam2.configure(config)
             self.picam2.start()
             
-            # Allow camera to stabilize
-            time.sleep(2)
+            # Allow camera to stabilize - proceed as soon as auto-exposure
+            # has converged (typically well under the 2 s upper bound)
+            deadline = time.monotonic() + 2.0
+            while time.monotonic() < deadline:
+                if self.picam2.capture_metadata().get("AeLocked"):
+                    break
             
             self.logger.info("PiCamera2 initialized successfully")
             
@@ -32,37 +153,201 @@ class BookwormQRScanner:
             raise
     
     def capture_frame(self):
-        """Capture frame from PiCamera2"""
+        """Capture grayscale (Y plane) frame from PiCamera2"""
+        from picamera2 import MappedArray
+        
         try:
-            frame = self.picam2.capture_array()
-            # Convert RGB to BGR for OpenCV
-            if frame is not None:
-                return True, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            return False, None
+            request = self.picam2.capture_request()
+            try:
+                # Copy only the Y plane (first 480 rows) straight out of the
+                # mapped camera buffer; the chroma planes are never touched
+                with MappedArray(request, "main") as mapped:
+                    frame = mapped.array[:480, :640].copy()
+            finally:
+                request.release()
+            return True, frame
         except Exception as e:
             self.logger.error(f"Frame capture failed: {e}")
             return False, None
     
     def decode_qr_codes(self, frame):
-        """Decode QR codes - same as before"""
+        """Decode QR codes from a grayscale frame"""
+        import cv2
+        
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            qr_codes = pyzbar.decode(gray)
+            if frame.ndim == 3:
+                # Colour frame from a non-YUV source: the green channel is a
+                # close enough luma proxy for QR detection and avoids a full
+                # BGR->GRAY conversion pass
+                frame = np.ascontiguousarray(frame[:, :, 1])
+            
+            # Skip pyzbar when the scene is unchanged since the last hit
+            signature = cv2.resize(frame, (16, 16), interpolation=cv2.INTER_AREA).tobytes()
+            now = time.monotonic()
+            if (signature == self._last_signature and self._last_result
+                    and now - self._last_result_time < self.RESULT_CACHE_SECONDS):
+                return self._last_result
+            
+            self._decode_count += 1
+            if self._decode_count % self.FULL_RES_EVERY == 0:
+                qr_codes = self._zbar_decode(frame)
+            else:
+                height, width = frame.shape[:2]
+                small = cv2.resize(frame, (width // 2, height // 2),
+                                   interpolation=cv2.INTER_AREA)
+                if NUMBA_AVAILABLE:
+                    # Only hand zbar the region around finder-pattern hints;
+                    # frames without any hint are skipped until the next
+                    # full-resolution pass
+                    roi = self._finder_roi(small)
+                    if roi is None:
+                        qr_codes = []
+                    else:
+                        x0, y0, x1, y1 = roi
+                        qr_codes = [self._scale_qr_code(qr, 2, (x0, y0))
+                                    for qr in self._zbar_decode(small[y0:y1, x0:x1])]
+                else:
+                    qr_codes = [self._scale_qr_code(qr, 2) for qr in self._zbar_decode(small)]
+            
+            self._last_signature = signature
+            self._last_result = qr_codes
+            self._last_result_time = now
             return qr_codes
         except Exception as e:
             self.logger.error(f"QR decode failed: {e}")
             return []
     
-    def run(self):
-        """Main loop for Bookworm"""
+    def _zbar_decode(self, gray):
+        """Decode a grayscale frame with a persistent zbar scanner and image
+        
+        pyzbar.decode() creates and destroys a scanner and image on every call
+        and copies the pixels with tobytes(); here both are created once and
+        the image is pointed straight at the numpy buffer.
+        """
+        from pyzbar import pyzbar, wrapper as zbar
+        from pyzbar.pyzbar_error import PyZbarError
+        
+        if self._zbar_scanner is None:
+            self._zbar_scanner = zbar.zbar_image_scanner_create()
+            self._zbar_image = zbar.zbar_image_create()
+            if not self._zbar_scanner or not self._zbar_image:
+                raise PyZbarError("Could not create zbar scanner")
+            zbar.zbar_image_set_format(self._zbar_image, ZBAR_Y800)
+        
+        gray = np.ascontiguousarray(gray)
+        height, width = gray.shape
+        zbar.zbar_image_set_size(self._zbar_image, width, height)
+        zbar.zbar_image_set_data(self._zbar_image, gray.ctypes.data_as(c_void_p), gray.size, None)
+        
+        if zbar.zbar_scan_image(self._zbar_scanner, self._zbar_image) < 0:
+            raise PyZbarError("Unsupported image format")
+        
+        # Reuse pyzbar's symbol unpacking so results match pyzbar.decode()
+        return list(pyzbar._decode_symbols(pyzbar._symbols_for_image(self._zbar_image)))
+    
+    def _finder_roi(self, gray):
+        """Bounding box (x0, y0, x1, y1) around finder-pattern hints, or None"""
+        hits = find_finder_rows(gray, int(gray.mean()))
+        rows = np.flatnonzero(hits[:, 0] >= 0)
+        if rows.size == 0:
+            return None
+        
+        height, width = gray.shape
+        margin = self.ROI_MARGIN
+        x0 = max(int(hits[rows, 0].min()) - margin, 0)
+        x1 = min(int(hits[rows, 1].max()) + margin, width)
+        y0 = max(int(rows[0]) - margin, 0)
+        y1 = min(int(rows[-1]) + 1 + margin, height)
+        return x0, y0, x1, y1
+    
+    def _scale_qr_code(self, qr_code, factor, offset=(0, 0)):
+        """Map a QR code decoded on a downsampled frame (or a region of it) back to full-frame coordinates"""
+        from pyzbar.locations import Point, Rect
+        
+        dx, dy = offset
+        left, top, width, height = qr_code.rect
+        rect = Rect((left + dx) * factor, (top + dy) * factor, width * factor, height * factor)
+        polygon = [Point((p.x + dx) * factor, (p.y + dy) * factor) for p in qr_code.polygon]
+        return qr_code._replace(rect=rect, polygon=polygon)
+    
+    def preview_frame(self, frame):
+        """Convert a grayscale frame to BGR for preview display only"""
+        import cv2
+        
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    
+    def _pin_thread(self, cpu, realtime=False):
+        """Pin the calling thread to one CPU and optionally make it SCHED_FIFO
+        
+        SCHED_FIFO needs CAP_SYS_NICE, e.g.:
+            sudo setcap cap_sys_nice+ep $(readlink -f $(which python3))
+        """
+        try:
+            if cpu in os.sched_getaffinity(0):
+                os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            self.logger.warning(f"Could not pin thread to CPU {cpu}: {e}")
+        
+        if realtime:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+            except (AttributeError, OSError) as e:
+                self.logger.warning(f"Could not enable SCHED_FIFO: {e}")
+    
+    def _capture_loop(self):
+        """Capture frames into the mailbox, dropping the oldest if full"""
+        self._pin_thread(self.CAPTURE_CPU, realtime=True)
+        
+        # Deadline-based pacing so capture cadence does not drift with
+        # the time spent capturing each frame
+        period = 1.0 / self.TARGET_FPS if self.TARGET_FPS else None
+        next_deadline = time.monotonic() + period if period else None
+        
         while self.running:
             try:
                 ret, frame = self.capture_frame()
                 if ret:
-                    qr_codes = self.decode_qr_codes(frame)
-                    # Process QR codes as before...
+                    try:
+                        self._frames.put_nowait(frame)
+                    except queue.Full:
+                        try:
+                            self._frames.get_nowait()
+                        except queue.Empty:
+                            pass
+                        self._frames.put_nowait(frame)
+                else:
+                    # Back off while the camera is failing
+                    time.sleep(0.5)
+                
+                if period:
+                    sleep_for = next_deadline - time.monotonic()
+                    if sleep_for > 0:
+                        time.sleep(sleep_for)
+                    else:
+                        # Missed the deadline - skip ahead to resynchronise
+                        self.logger.debug(f"Capture missed deadline by {-sleep_for:.3f}s")
+                        next_deadline += math.ceil(-sleep_for / period) * period
+                    next_deadline += period
                     
-                time.sleep(0.1)
+            except Exception as e:
+                self.logger.error(f"Error in capture loop: {e}")
+                time.sleep(1)
+    
+    def run(self):
+        """Main loop for Bookworm - decodes frames from the capture thread"""
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+        self._pin_thread(self.DECODE_CPU)
+        
+        while self.running:
+            try:
+                try:
+                    frame = self._frames.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                
+                qr_codes = self.decode_qr_codes(frame)
+                # Process QR codes as before...
                 
             except Exception as e:
                 self.logger.error(f"Error in main loop: {e}")
@@ -70,5 +355,16 @@ class BookwormQRScanner:
     
     def cleanup(self):
         """Cleanup PiCamera2"""
+        self.running = False
+        if self._capture_thread:
+            self._capture_thread.join(timeout=2)
         if self.picam2:
             self.picam2.stop()
+        if self._zbar_scanner:
+            from pyzbar import wrapper as zbar
+            
+            zbar.zbar_image_destroy(self._zbar_image)
+            zbar.zbar_image_scanner_destroy(self._zbar_scanner)
+            self._zbar_image = None
+            self._zbar_scanner = None
+        self._log_listener.stop()
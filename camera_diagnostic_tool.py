@@ -5,15 +5,31 @@ Diagnoses camera issues and tests different approaches
 """
 
 import cv2
+import concurrent.futures
+import hashlib
+import json
 import subprocess
 import os
+import re
 import time
 import sys
 
-def run_system_command(command):
-    """Run a system command and return the output"""
+# During sustained capture, decode (retrieve) only one in this many grabbed frames
+RETRIEVE_EVERY = 15
+
+# lsusb lines that look like camera devices
+CAMERA_KEYWORD_RE = re.compile(r'camera|webcam|video|capture', re.IGNORECASE)
+
+# Number of frames captured by the sustained capture test
+SUSTAINED_FRAMES = 150
+
+# Last working (device, backend) pair, reused to skip full backend probing
+PROBE_CACHE_FILE = os.path.expanduser("~/.cache/qrscanner/probe.json")
+
+def run_system_command(argv):
+    """Run a system command (argv list, no shell) and return the output"""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=10)
         return result.returncode, result.stdout, result.stderr
     except subprocess.TimeoutExpired:
         return -1, "", "Command timed out"
@@ -24,21 +40,35 @@ def check_camera_devices():
     """Check available camera devices"""
     print("=== CAMERA DEVICE DETECTION ===")
     
+    # The system tool checks are independent and mostly wait on I/O, so
+    # launch them all up front and collect the results in order below
+    commands = [
+        ['v4l2-ctl', '--list-devices'],
+        ['lsusb'],
+        ['vcgencmd', 'get_camera'],
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(commands)) as executor:
+        results = list(executor.map(run_system_command, commands))
+    v4l2_result, lsusb_result, vcgencmd_result = results
+    
     # Method 1: Check /dev/video* devices
     print("\n1. Checking /dev/video* devices:")
-    video_devices = []
-    for i in range(10):
-        device_path = f"/dev/video{i}"
-        if os.path.exists(device_path):
-            video_devices.append(i)
-            print(f"   Found: {device_path}")
+    try:
+        # One directory read finds every /dev/videoN, with no upper bound
+        video_devices = sorted(int(entry.name[5:]) for entry in os.scandir('/dev')
+                               if entry.name.startswith('video') and entry.name[5:].isdigit())
+    except OSError:
+        video_devices = [i for i in range(10) if os.path.exists(f"/dev/video{i}")]
+    
+    for i in video_devices:
+        print(f"   Found: /dev/video{i}")
     
     if not video_devices:
         print("   No /dev/video* devices found")
     
     # Method 2: Use v4l2-ctl if available
     print("\n2. Using v4l2-ctl (if available):")
-    returncode, stdout, stderr = run_system_command("v4l2-ctl --list-devices")
+    returncode, stdout, stderr = v4l2_result
     if returncode == 0:
         print(stdout)
     else:
@@ -46,27 +76,92 @@ def check_camera_devices():
     
     # Method 3: Check lsusb for USB cameras
     print("\n3. Checking USB devices:")
-    returncode, stdout, stderr = run_system_command("lsusb")
+    returncode, stdout, stderr = lsusb_result
     if returncode == 0:
         usb_lines = stdout.split('\n')
-        camera_keywords = ['camera', 'webcam', 'video', 'capture']
         for line in usb_lines:
-            if any(keyword in line.lower() for keyword in camera_keywords):
+            if CAMERA_KEYWORD_RE.search(line):
                 print(f"   Possible camera: {line}")
     
     # Method 4: Check for Raspberry Pi camera
     print("\n4. Checking Raspberry Pi camera:")
-    returncode, stdout, stderr = run_system_command("vcgencmd get_camera")
+    returncode, stdout, stderr = vcgencmd_result
     if returncode == 0:
         print(f"   Camera status: {stdout.strip()}")
     
-    # Check if camera is enabled in config
-    returncode, stdout, stderr = run_system_command("grep 'camera' /boot/config.txt")
-    if returncode == 0:
-        print(f"   Config.txt camera settings: {stdout.strip()}")
+    # Check if camera is enabled in config (read directly - no grep process)
+    try:
+        with open('/boot/config.txt', 'r') as f:
+            camera_lines = [line.strip() for line in f if 'camera' in line]
+        if camera_lines:
+            settings = '\n'.join(camera_lines)
+            print(f"   Config.txt camera settings: {settings}")
+    except OSError:
+        pass
     
     return video_devices
 
+def _probe_cache_key():
+    """Key that changes when the OpenCV version or video devices change"""
+    try:
+        devices = sorted(name for name in os.listdir('/dev') if name.startswith('video'))
+    except OSError:
+        devices = []
+    return hashlib.sha1(f"{cv2.__version__}|{','.join(devices)}".encode()).hexdigest()
+
+def _load_probe_cache():
+    """Return the cached (device_id, backend_id), or None if missing or stale"""
+    try:
+        with open(PROBE_CACHE_FILE, 'r') as f:
+            cache = json.load(f)
+        if cache.get('key') == _probe_cache_key():
+            return cache['device_id'], cache['backend_id']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _save_probe_cache(device_id, backend_id):
+    """Remember a working (device_id, backend_id) pair"""
+    try:
+        os.makedirs(os.path.dirname(PROBE_CACHE_FILE), exist_ok=True)
+        with open(PROBE_CACHE_FILE, 'w') as f:
+            json.dump({'key': _probe_cache_key(), 'device_id': device_id,
+                       'backend_id': backend_id}, f)
+    except OSError as e:
+        print(f"    Could not save probe cache: {e}")
+
+def _clear_probe_cache():
+    """Invalidate the probe cache after a capture failure"""
+    try:
+        os.remove(PROBE_CACHE_FILE)
+    except OSError:
+        pass
+
+def _try_backend(device_id, backend_id, backend_name):
+    """Open a device with one backend and read a frame; True on success"""
+    cap = cv2.VideoCapture(device_id, backend_id)
+    try:
+        if cap.isOpened():
+            # Try to read a frame
+            ret, frame = cap.read()
+            if ret and frame is not None:
+                height, width = frame.shape[:2]
+                print(f"    SUCCESS: Device {device_id} with {backend_name}")
+                print(f"    Frame size: {width}x{height}")
+                
+                # Get camera properties
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+                print(f"    FPS: {fps}, FOURCC: {fourcc}")
+                return True
+            else:
+                print(f"    Device {device_id} opened but cannot read frames")
+        else:
+            print(f"    Device {device_id} failed to open")
+        return False
+    finally:
+        cap.release()
+
 def test_opencv_backends():
     """Test different OpenCV backends"""
     print("\n=== OPENCV BACKEND TESTING ===")
@@ -82,34 +177,29 @@ def test_opencv_backends():
     if hasattr(cv2, 'CAP_LIBV4L'):
         additional_backends.append((cv2.CAP_LIBV4L, "LibV4L"))
     
+    backend_names = dict(backends + additional_backends)
+    
+    # Try the last working combination first
+    cached = _load_probe_cache()
+    if cached and cached[1] in backend_names:
+        device_id, backend_id = cached
+        backend_name = backend_names[backend_id]
+        print(f"\nTrying cached device {device_id} with {backend_name}:")
+        try:
+            if _try_backend(device_id, backend_id, backend_name):
+                return device_id, backend_id, backend_name
+        except Exception as e:
+            print(f"    Error testing device {device_id}: {e}")
+        _clear_probe_cache()
+    
     for backend_id, backend_name in backends + additional_backends:
         print(f"\nTesting {backend_name} backend:")
         for device_id in range(3):  # Test devices 0, 1, 2
             try:
                 print(f"  Trying device {device_id}...")
-                cap = cv2.VideoCapture(device_id, backend_id)
-                
-                if cap.isOpened():
-                    # Try to read a frame
-                    ret, frame = cap.read()
-                    if ret and frame is not None:
-                        height, width = frame.shape[:2]
-                        print(f"    SUCCESS: Device {device_id} with {backend_name}")
-                        print(f"    Frame size: {width}x{height}")
-                        
-                        # Get camera properties
-                        fps = cap.get(cv2.CAP_PROP_FPS)
-                        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
-                        print(f"    FPS: {fps}, FOURCC: {fourcc}")
-                        
-                        cap.release()
-                        return device_id, backend_id, backend_name
-                    else:
-                        print(f"    Device {device_id} opened but cannot read frames")
-                else:
-                    print(f"    Device {device_id} failed to open")
-                
-                cap.release()
+                if _try_backend(device_id, backend_id, backend_name):
+                    _save_probe_cache(device_id, backend_id)
+                    return device_id, backend_id, backend_name
                 
             except Exception as e:
                 print(f"    Error testing device {device_id}: {e}")
@@ -120,44 +210,60 @@ def test_gstreamer_pipeline():
     """Test GStreamer pipeline for Raspberry Pi camera"""
     print("\n=== GSTREAMER PIPELINE TEST ===")
     
+    # Low-latency sink: keep one frame, drop stale ones, don't sync to clock
+    sink = "appsink max-buffers=1 drop=true sync=false emit-signals=false"
+    
+    # Test pattern (should always work if GStreamer is installed)
+    test_pipeline = f"videotestsrc ! video/x-raw,width=640,height=480 ! videoconvert ! {sink}"
+    
     # Common GStreamer pipelines for Raspberry Pi
     pipelines = [
         # Raspberry Pi camera module
-        "libcamerasrc ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! appsink",
+        f"libcamerasrc ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! {sink}",
         
-        # Legacy raspivid approach
-        "v4l2src device=/dev/video0 ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! appsink",
+        # Legacy raspivid approach (io-mode=4 requests DMABUF buffers)
+        f"v4l2src device=/dev/video0 io-mode=4 ! video/x-raw,width=640,height=480,framerate=30/1 ! videoconvert ! {sink}",
         
         # USB camera
-        "v4l2src device=/dev/video0 ! videoconvert ! appsink",
-        
-        # Test pattern (should always work if GStreamer is installed)
-        "videotestsrc ! video/x-raw,width=640,height=480 ! videoconvert ! appsink"
+        f"v4l2src device=/dev/video0 io-mode=4 ! videoconvert ! {sink}",
     ]
     
+    # Quick check that GStreamer works at all before probing cameras
+    print(f"\nTesting GStreamer with test pattern: {test_pipeline}")
+    if not _try_pipeline(test_pipeline):
+        print("    GStreamer is not working - skipping camera pipelines")
+        return None
+    
     for i, pipeline in enumerate(pipelines):
         print(f"\nTesting pipeline {i+1}: {pipeline}")
-        try:
-            cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
-            
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    print(f"    SUCCESS: Pipeline works!")
-                    print(f"    Frame size: {frame.shape[1]}x{frame.shape[0]}")
-                    cap.release()
-                    return pipeline
-                else:
-                    print(f"    Pipeline opened but no frames")
+        if _try_pipeline(pipeline):
+            return pipeline
+    
+    return test_pipeline
+
+def _try_pipeline(pipeline):
+    """Open a GStreamer pipeline and read one frame; True on success"""
+    try:
+        cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+        
+        if cap.isOpened():
+            ret, frame = cap.read()
+            if ret and frame is not None:
+                print(f"    SUCCESS: Pipeline works!")
+                print(f"    Frame size: {frame.shape[1]}x{frame.shape[0]}")
+                cap.release()
+                return True
             else:
-                print(f"    Pipeline failed to open")
-            
-            cap.release()
-            
-        except Exception as e:
-            print(f"    Error: {e}")
+                print(f"    Pipeline opened but no frames")
+        else:
+            print(f"    Pipeline failed to open")
+        
+        cap.release()
+        
+    except Exception as e:
+        print(f"    Error: {e}")
     
-    return None
+    return False
 
 def test_basic_camera_access():
     """Test basic camera access with multiple methods"""
@@ -178,33 +284,41 @@ def test_basic_camera_access():
             cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
             cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             cap.set(cv2.CAP_PROP_FPS, 30)
+            # Single driver buffer so every read returns the freshest frame
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
             frame_count = 0
-            start_time = time.time()
-            
-            print("Capturing frames for 5 seconds...")
-            while time.time() - start_time < 5:
-                ret, frame = cap.read()
-                if ret:
-                    frame_count += 1
-                else:
-                    print(f"Frame read failed at frame {frame_count}")
+            decoded_count = 0
+            print(f"Capturing {SUSTAINED_FRAMES} frames...")
+            start_time = time.perf_counter()
+            for _ in range(SUSTAINED_FRAMES):
+                # grab() only dequeues the frame; pixels are decoded by
+                # retrieve() for a sample of frames
+                if not cap.grab():
+                    print(f"Frame grab failed at frame {frame_count}")
+                    _clear_probe_cache()
                     break
+                frame_count += 1
                 
-                time.sleep(0.1)  # Small delay
+                if frame_count % RETRIEVE_EVERY == 0:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        decoded_count += 1
             
+            elapsed = time.perf_counter() - start_time
             cap.release()
             
-            elapsed = time.time() - start_time
             fps = frame_count / elapsed
+            decoded_fps = decoded_count / elapsed
             
             print(f"Captured {frame_count} frames in {elapsed:.2f} seconds")
-            print(f"Effective FPS: {fps:.2f}")
+            print(f"Effective FPS: {fps:.2f} grabbed, {decoded_fps:.2f} decoded")
             
             return True
             
         except Exception as e:
             print(f"Error during sustained capture: {e}")
+            _clear_probe_cache()
             return False
     
     else:
@@ -5,11 +5,16 @@ Handles different PiCamera2 versions and provides better error diagnostics
 """
 
 import cv2
+import numpy as np
 import logging
+import queue
+import threading
 import time
 import sys
 import subprocess
 from pyzbar import pyzbar
+from pyzbar.pyzbar import ZBarSymbol
+from pyzbar.locations import Point, Rect
 
 # Check PiCamera2 availability and version
 try:
@@ -23,7 +28,30 @@ except ImportError as e:
     PICAMERA2_VERSION = None
     print(f"PiCamera2 import failed: {e}")
 
+# Camera info attribute offered by this PiCamera2 version, resolved once.
+# camera_properties is preferred: sensor_modes has to probe every mode.
+CAMERA_INFO_ATTR = None
+if PICAMERA2_AVAILABLE:
+    CAMERA_INFO_ATTR = next((name for name in ('camera_properties', 'camera_info', 'sensor_modes')
+                             if hasattr(Picamera2, name)), None)
+
+# Older PiCamera2 releases have no request/MappedArray API
+try:
+    from picamera2 import MappedArray
+except ImportError:
+    MappedArray = None
+
 class CompatibleBookwormScanner:
+    # Frames larger than this are downscaled before decoding
+    SCAN_SIZE = (320, 240)
+    
+    # After this many downscaled frames without a QR code, decode one frame
+    # at full resolution to catch small or distant codes
+    FULL_RES_AFTER_MISSES = 5
+    
+    # Frames between status lines in the main loop
+    STATUS_EVERY_FRAMES = 300
+    
     def __init__(self):
         """Initialize scanner with version compatibility"""
         # Setup logging
@@ -37,6 +65,22 @@ class CompatibleBookwormScanner:
         self.picam2 = None
         self.running = True
         
+        # Single-slot mailbox: the capture thread always replaces the
+        # pending frame so the decoder only ever sees the freshest one
+        self.frame_box = queue.Queue(maxsize=1)
+        self._capture_thread = None
+        
+        # Reusable grayscale work buffers for decode_qr_codes, keyed by
+        # (purpose, shape)
+        self._work_bufs = {}
+        
+        # Consecutive downscaled decodes without a hit
+        self._scan_misses = 0
+        
+        # Outline point arrays per QR code data from the last drawn frame,
+        # for preview drawing
+        self._poly_cache = {}
+        
         print(f"Scanner initialized - PiCamera2 available: {PICAMERA2_AVAILABLE}")
         if PICAMERA2_AVAILABLE:
             print(f"PiCamera2 version: {PICAMERA2_VERSION}")
@@ -125,26 +169,11 @@ class CompatibleBookwormScanner:
     def _log_camera_info(self):
         """Log camera information in a version-compatible way"""
         try:
-            # Try different methods to get camera info
-            info_methods = [
-                ('camera_info', lambda: getattr(self.picam2, 'camera_info', None)),
-                ('sensor_modes', lambda: getattr(self.picam2, 'sensor_modes', None)),
-                ('camera_properties', lambda: getattr(self.picam2, 'camera_properties', None)),
-            ]
-            
-            found_info = False
-            for method_name, method_func in info_methods:
-                try:
-                    info = method_func()
-                    if info:
-                        self.logger.info(f"Camera {method_name}: {info}")
-                        print(f"Camera {method_name}: {info}")
-                        found_info = True
-                        break
-                except Exception as e:
-                    self.logger.debug(f"Could not get {method_name}: {e}")
-            
-            if not found_info:
+            info = getattr(self.picam2, CAMERA_INFO_ATTR) if CAMERA_INFO_ATTR else None
+            if info:
+                self.logger.info(f"Camera {CAMERA_INFO_ATTR}: {info}")
+                print(f"Camera {CAMERA_INFO_ATTR}: {info}")
+            else:
                 self.logger.info("Camera detected but detailed info not available")
                 print("Camera detected (detailed info not available)")
                 
@@ -154,21 +183,28 @@ class CompatibleBookwormScanner:
     
     def _create_compatible_config(self):
         """Create camera configuration compatible with different versions"""
+        # YUV420 so the Y (luma) plane can be decoded directly without any
+        # colour conversion. A single buffer and no frame queue means frames
+        # are captured on demand, so a slow decode never gets a stale frame
         config_methods = [
             # Method 1: Modern create_video_configuration
             lambda: self.picam2.create_video_configuration({
                 "size": (640, 480),
-                "format": "RGB888"
-            }),
+                "format": "YUV420"
+            }, buffer_count=1, queue=False),
             
             # Method 2: create_preview_configuration (alternative)
             lambda: self.picam2.create_preview_configuration(
-                main={"size": (640, 480), "format": "RGB888"}
+                main={"size": (640, 480), "format": "YUV420"},
+                buffer_count=1,
+                queue=False
             ),
             
             # Method 3: Direct configuration dict
             lambda: {
-                "main": {"size": (640, 480), "format": "RGB888"},
+                "main": {"size": (640, 480), "format": "YUV420"},
+                "buffer_count": 1,
+                "queue": False,
                 "controls": {"FrameDurationLimits": (33333, 33333)}
             }
         ]
@@ -247,10 +283,16 @@ class CompatibleBookwormScanner:
             return False, None
         
         try:
-            frame = self.picam2.capture_array()
+            if MappedArray is not None:
+                frame = self._capture_from_request()
+            else:
+                frame = self.picam2.capture_array()
+            
             if frame is not None and frame.size > 0:
                 # Handle different frame formats
-                if len(frame.shape) == 3:
+                if len(frame.shape) == 2:  # YUV420 - Y plane is the first 480 rows
+                    frame_bgr = frame[:480, :640]
+                elif len(frame.shape) == 3:
                     if frame.shape[2] == 3:  # RGB
                         frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
                     elif frame.shape[2] == 4:  # RGBA
@@ -268,39 +310,138 @@ class CompatibleBookwormScanner:
             self.logger.error(f"Frame capture error: {e}")
             return False, None
     
+    def _capture_from_request(self):
+        """Copy the frame straight out of the mapped camera buffer
+        
+        The request is released immediately so the single driver buffer is
+        back with the camera while the frame is decoded. For YUV420 only the
+        Y plane is copied.
+        """
+        request = self.picam2.capture_request()
+        try:
+            with MappedArray(request, "main") as mapped:
+                if len(mapped.array.shape) == 2:
+                    return mapped.array[:480, :640].copy()
+                return mapped.array.copy()
+        finally:
+            request.release()
+    
     def decode_qr_codes(self, frame):
         """Decode QR codes with enhanced detection"""
         try:
             if frame is None:
                 return []
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # YUV420 frames are already grayscale (Y plane)
+            if len(frame.shape) == 3:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                    dst=self._decode_buffer('gray', frame.shape[:2]))
+            else:
+                gray = frame
+            
+            # Decode a downscaled copy unless it's time for a full-res pass
+            scale = 1.0
+            scan_width, scan_height = self.SCAN_SIZE
+            if gray.shape[1] > scan_width and self._scan_misses < self.FULL_RES_AFTER_MISSES:
+                scale = gray.shape[1] / scan_width
+                gray = cv2.resize(gray, self.SCAN_SIZE, interpolation=cv2.INTER_AREA,
+                                  dst=self._decode_buffer('scan', (scan_height, scan_width)))
             
-            # Try multiple detection approaches
-            detection_methods = [
-                ("direct", gray),
-                ("enhanced", cv2.equalizeHist(gray)),
-                ("gaussian", cv2.GaussianBlur(gray, (3, 3), 0)),
-            ]
+            eq_buf = self._decode_buffer('enhanced', gray.shape)
+            blur_buf = self._decode_buffer('gaussian', gray.shape)
             
-            for method_name, processed_frame in detection_methods:
-                qr_codes = pyzbar.decode(processed_frame)
+            # Try multiple detection approaches - the preprocessed variants
+            # are only built if the previous passes found nothing
+            detection_methods = (
+                ("direct", lambda: gray),
+                ("enhanced", lambda: cv2.equalizeHist(gray, dst=eq_buf)),
+                ("gaussian", lambda: cv2.GaussianBlur(gray, (3, 3), 0, dst=blur_buf)),
+            )
+            
+            for method_name, preprocess in detection_methods:
+                # QR codes only - skips zbar's other symbology decoders
+                qr_codes = pyzbar.decode(preprocess(), symbols=[ZBarSymbol.QRCODE])
                 if qr_codes:
+                    self._scan_misses = 0
+                    if scale != 1.0:
+                        qr_codes = [self._scale_qr_code(qr, scale) for qr in qr_codes]
                     self.logger.info(f"QR codes found using {method_name} method: {len(qr_codes)}")
                     for qr in qr_codes:
                         qr_data = qr.data.decode('utf-8')
                         print(f"QR Code detected: '{qr_data}'")
                     return qr_codes
             
+            # Count misses on downscaled frames; a full-res miss starts over
+            self._scan_misses = self._scan_misses + 1 if scale != 1.0 else 0
             return []
             
         except Exception as e:
             self.logger.error(f"QR decode failed: {e}")
             return []
     
+    def _decode_buffer(self, purpose, shape):
+        """Return a reusable uint8 buffer for one decode step
+        
+        Only used on the decode thread, and pyzbar copies the pixels it is
+        given, so the contents may be overwritten on the next frame. Frames
+        from capture_frame() are not pooled because they are handed between
+        threads and may still be in use when the next frame arrives.
+        """
+        key = (purpose, shape)
+        buf = self._work_bufs.get(key)
+        if buf is None:
+            buf = self._work_bufs[key] = np.empty(shape, np.uint8)
+        return buf
+    
+    def _scale_qr_code(self, qr_code, scale):
+        """Map a QR code found on a downscaled frame back to full-frame coordinates"""
+        rect = Rect(*(int(round(value * scale)) for value in qr_code.rect))
+        polygon = [Point(int(round(p.x * scale)), int(round(p.y * scale))) for p in qr_code.polygon]
+        return qr_code._replace(rect=rect, polygon=polygon)
+    
+    def _draw_qr_outlines(self, frame, qr_codes):
+        """Draw all QR code outlines with one polylines call, reusing point
+        arrays for codes that have not moved"""
+        outlines = []
+        # Only codes in this frame are kept, so the cache never outgrows
+        # what is on screen
+        poly_cache = {}
+        for qr_code in qr_codes:
+            points = qr_code.polygon
+            if len(points) >= 4:
+                cached = self._poly_cache.get(qr_code.data)
+                if cached is None or cached[0] != points:
+                    pts = np.fromiter((c for p in points for c in (p.x, p.y)),
+                                      dtype=np.int32, count=2 * len(points)).reshape(-1, 1, 2)
+                    cached = (points, pts)
+                poly_cache[qr_code.data] = cached
+                outlines.append(cached[1])
+        self._poly_cache = poly_cache
+        
+        if outlines:
+            try:
+                cv2.polylines(frame, outlines, True, (0, 255, 0), 2)
+            except:
+                pass
+    
+    def _capture_loop(self):
+        """Capture thread - keeps the mailbox filled with the newest frame"""
+        while self.running:
+            ret, frame = self.capture_frame()
+            
+            if not ret or frame is None:
+                self.logger.warning("Frame capture failed")
+                time.sleep(0.5)
+                continue
+            
+            try:
+                self.frame_box.get_nowait()
+            except queue.Empty:
+                pass
+            self.frame_box.put(frame)
+    
     def run(self):
-        """Main scanner loop"""
+        """Main scanner loop - decodes frames delivered by the capture thread"""
         print("\n=== STARTING SCANNER ===")
         
         if not self.initialize_camera():
@@ -313,15 +454,16 @@ class CompatibleBookwormScanner:
         
         frame_count = 0
         qr_count = 0
-        last_status = time.time()
+        preview = len(sys.argv) > 1 and sys.argv[1] == "--preview"
+        
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
         
         try:
             while self.running:
-                ret, frame = self.capture_frame()
-                
-                if not ret or frame is None:
-                    self.logger.warning("Frame capture failed")
-                    time.sleep(0.5)
+                try:
+                    frame = self.frame_box.get(timeout=1.0)
+                except queue.Empty:
                     continue
                 
                 frame_count += 1
@@ -331,31 +473,23 @@ class CompatibleBookwormScanner:
                 if qr_codes:
                     qr_count += len(qr_codes)
                 
-                # Status update every 10 seconds
-                current_time = time.time()
-                if current_time - last_status > 10:
+                # Status update every STATUS_EVERY_FRAMES frames (~10 s at 30 fps)
+                if frame_count % self.STATUS_EVERY_FRAMES == 0:
                     print(f"Status: {frame_count} frames processed, {qr_count} QR codes found")
-                    last_status = current_time
                 
                 # Preview mode
-                if len(sys.argv) > 1 and sys.argv[1] == "--preview":
+                if preview:
+                    if len(frame.shape) == 2:
+                        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                    
                     # Draw QR code boundaries
-                    for qr_code in qr_codes:
-                        points = qr_code.polygon
-                        if len(points) >= 4:
-                            try:
-                                pts = [(p.x, p.y) for p in points]
-                                for i in range(len(pts)):
-                                    cv2.line(frame, pts[i], pts[(i+1) % len(pts)], (0, 255, 0), 2)
-                            except:
-                                pass
+                    if qr_codes:
+                        self._draw_qr_outlines(frame, qr_codes)
                     
                     cv2.imshow('QR Scanner', frame)
                     if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
                 
-                time.sleep(0.1)
-                
         except KeyboardInterrupt:
             print("\nStopping scanner...")
         except Exception as e:
@@ -371,6 +505,9 @@ class CompatibleBookwormScanner:
         print("Cleaning up...")
         self.running = False
         
+        if self._capture_thread:
+            self._capture_thread.join(timeout=2)
+        
         if self.picam2:
             try:
                 self.picam2.stop()
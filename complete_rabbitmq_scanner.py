@@ -4,14 +4,18 @@ Complete Bookworm QR Scanner with RabbitMQ Integration
 """
 
 import cv2
+import numpy as np
 import json
 import pika
 import logging
+import logging.handlers
 import time
 import sys
-import subprocess
+import queue
+import threading
 from datetime import datetime
 from pyzbar import pyzbar
+from pyzbar.locations import Point, Rect
 from pathlib import Path
 
 try:
@@ -23,28 +27,112 @@ except ImportError:
     PICAMERA2_AVAILABLE = False
     PICAMERA2_VERSION = None
 
+# Older PiCamera2 releases have no request/MappedArray API
+try:
+    from picamera2 import MappedArray
+except ImportError:
+    MappedArray = None
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Optional: Numba JIT for the blur pre-filter
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def laplacian_variance(gray):
+        """Variance of the 4-neighbour Laplacian - low values mean a blurry or empty frame"""
+        height, width = gray.shape
+        total = 0.0
+        total_sq = 0.0
+        for y in range(1, height - 1):
+            for x in range(1, width - 1):
+                lap = (4.0 * gray[y, x] - gray[y - 1, x] - gray[y + 1, x]
+                       - gray[y, x - 1] - gray[y, x + 1])
+                total += lap
+                total_sq += lap * lap
+        count = (height - 2) * (width - 2)
+        mean = total / count
+        return total_sq / count - mean * mean
+else:
+    def laplacian_variance(gray):
+        """Variance of the Laplacian - low values mean a blurry or empty frame"""
+        return cv2.Laplacian(gray, cv2.CV_32F).var()
+
+def encode_message(message):
+    """Serialize a message compactly for RabbitMQ"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(message)
+    return json.dumps(message, separators=(',', ':')).encode()
+
 class CompleteBookwormScanner:
+    # Decode at this size first; go full-res after this many empty frames
+    SCAN_SIZE = (320, 240)
+    FULL_RES_AFTER_MISSES = 5
+    # Frames whose Laplacian variance is below this are too blurry to decode
+    SHARPNESS_THRESHOLD = 50.0
+    # Publish in batches of this many messages or every PUBLISH_INTERVAL seconds
+    PUBLISH_BATCH_SIZE = 32
+    PUBLISH_INTERVAL = 0.2
+    # Prune expired duplicate-scan entries once the table grows past this
+    MAX_TRACKED_SCANS = 1024
+    
     def __init__(self, config_file='config.json'):
-        # Setup logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler(sys.stdout)]
-        )
-        self.logger = logging.getLogger(__name__)
-        
         # Load configuration
         self.config = self.load_config(config_file)
         
+        self.logger = self.setup_logging()
+        
+        # Normalized (uppercase) -> config key lookups for QR dispatch;
+        # locations are flattened to (code, description) by load_config
+        locations = self.config['qr_codes']['locations']
+        objects = self.config['qr_codes']['objects']
+        self._obj_map = {key.upper(): key for key in objects}
+        # Exact payload bytes -> config entry, checked before any decoding
+        self._loc_bytes = {loc[0].encode(): loc for loc in self._locations.values()}
+        self._obj_bytes = {key.encode(): key for key in objects}
+        self._available_locations = f"Available locations: {list(locations)}"
+        self._available_objects = f"Available objects: {list(objects)}"
+        self._dup_window = self.config['processing_rules']['duplicate_scan_window_seconds']
+        
         # Initialize state
         self.picam2 = None
-        self.running = True
+        self.running = threading.Event()
+        self.running.set()
         self.current_location = None
+        # Set once a location is known - objects then take the fast path
+        self._state_obj_mode = False
         self.last_scans = {}
+        self._device_id = self._read_device_id()
+        self._scanner_id = f"bookworm_pi_{self._device_id}"
+        self._miss_count = 0
+        self._use_opencl = False
+        # Reused decode-thread buffers for the downscale and the preview
+        self._scan_buf = np.empty(self.SCAN_SIZE[::-1], dtype=np.uint8)
+        self._preview_buf = np.empty((480, 640, 3), dtype=np.uint8)
+        
+        # Capture/decode pipeline - latest frame only
+        self._frames = queue.Queue(maxsize=1)
+        self.frame_count = 0
+        self.qr_count = 0
+        self.message_count = 0
         
         # RabbitMQ components
         self.rabbitmq_connection = None
         self.rabbitmq_channel = None
+        self._publish_queue = queue.Queue()
+        self._publisher_thread = None
+        self._channel_ready = threading.Event()
+        self._delivery_tag = 0
+        self._unconfirmed = {}
         
         print(f"Scanner initialized with config from {config_file}")
     
@@ -68,6 +156,15 @@ class CompleteBookwormScanner:
                 print(f"ERROR: Missing required config sections: {missing}")
                 sys.exit(1)
             
+            # Flatten location descriptions once: uppercase code -> (code, description)
+            self._locations = {}
+            for key, info in config['qr_codes']['locations'].items():
+                if isinstance(info, dict):
+                    description = info.get('description', info.get('name', key))
+                else:
+                    description = info
+                self._locations[key.upper()] = (key, str(description))
+            
             print(f"Configuration loaded: {len(config['qr_codes']['locations'])} locations, {len(config['qr_codes']['objects'])} objects")
             
             if 'rabbitmq' in config:
@@ -84,6 +181,37 @@ class CompleteBookwormScanner:
             print(f"ERROR: Failed to load config: {e}")
             sys.exit(1)
     
+    def setup_logging(self):
+        """Per-scan detail goes to a rotating log file; stdout only gets warnings
+        
+        If the log file cannot be opened, stdout gets everything instead so
+        local-mode messages are not lost.
+        """
+        settings = self.config['scanner_settings']
+        log_level = settings.get('log_level', 'INFO')
+        log_file = settings.get('log_file', '/var/log/qr_scanner.log')
+        
+        logger = logging.getLogger(__name__)
+        logger.setLevel(log_level)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(logging.WARNING)
+        console.setFormatter(formatter)
+        logger.addHandler(console)
+        
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=5 * 1024 * 1024, backupCount=3
+            )
+            file_handler.setFormatter(formatter)
+            logger.addHandler(file_handler)
+        except OSError as e:
+            print(f"WARNING: File logging disabled, logging to stdout: {e}")
+            console.setLevel(log_level)
+        
+        return logger
+    
     def initialize_camera(self):
         """Initialize camera with compatibility handling"""
         if not PICAMERA2_AVAILABLE:
@@ -94,10 +222,11 @@ class CompleteBookwormScanner:
             print("Initializing PiCamera2...")
             self.picam2 = Picamera2()
             
-            # Create configuration (try multiple methods for compatibility)
+            # Create configuration (try multiple methods for compatibility).
+            # YUV420 so the Y (luma) plane goes straight to pyzbar.
             config_methods = [
-                lambda: self.picam2.create_video_configuration({"size": (640, 480), "format": "RGB888"}),
-                lambda: self.picam2.create_preview_configuration(main={"size": (640, 480), "format": "RGB888"}),
+                lambda: self.picam2.create_video_configuration({"size": (640, 480), "format": "YUV420"}),
+                lambda: self.picam2.create_preview_configuration(main={"size": (640, 480), "format": "YUV420"}),
             ]
             
             config = None
@@ -122,6 +251,9 @@ class CompleteBookwormScanner:
                 raise Exception("Camera started but cannot capture frames")
             
             print(f"Camera initialized successfully - Frame: {test_frame.shape}")
+            self._use_opencl = self._opencl_resize_is_faster(test_frame[:480, :640])
+            # Compile the blur pre-filter now rather than on the first scanned frame
+            laplacian_variance(self._scan_buf)
             return True
             
         except Exception as e:
@@ -159,26 +291,36 @@ class CompleteBookwormScanner:
                 blocked_connection_timeout=300
             )
             
-            self.rabbitmq_connection = pika.BlockingConnection(parameters)
-            self.rabbitmq_channel = self.rabbitmq_connection.channel()
+            # Declare exchange and queues on a short-lived blocking connection
+            # so a broker problem drops us into local mode straight away
+            setup_connection = pika.BlockingConnection(parameters)
+            setup_channel = setup_connection.channel()
             
-            # Declare exchange and queues
-            self.rabbitmq_channel.exchange_declare(
+            setup_channel.exchange_declare(
                 exchange=rabbitmq_config['exchange'],
                 exchange_type='topic',
                 durable=True
             )
             
-            self.rabbitmq_channel.queue_declare(
+            setup_channel.queue_declare(
                 queue=rabbitmq_config['queue_scan_results'],
                 durable=True
             )
             
-            self.rabbitmq_channel.queue_bind(
+            setup_channel.queue_bind(
                 exchange=rabbitmq_config['exchange'],
                 queue=rabbitmq_config['queue_scan_results'],
                 routing_key=rabbitmq_config['routing_key_scan']
             )
+            setup_connection.close()
+            
+            # Publishing happens on a dedicated thread with async confirms
+            self._publisher_thread = threading.Thread(
+                target=self._publisher_loop, args=(parameters,), name="publisher", daemon=True
+            )
+            self._publisher_thread.start()
+            if not self._channel_ready.wait(timeout=10):
+                raise Exception("Timed out waiting for publisher channel")
             
             print("RabbitMQ connection established successfully")
             return True
@@ -190,124 +332,302 @@ class CompleteBookwormScanner:
             self.rabbitmq_channel = None
             return True  # Continue without RabbitMQ
     
+    def _publisher_loop(self, parameters):
+        """Own the RabbitMQ connection and run its I/O loop"""
+        try:
+            self.rabbitmq_connection = pika.SelectConnection(
+                parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_closed,
+                on_close_callback=self._on_connection_closed
+            )
+            self.rabbitmq_connection.ioloop.start()
+        except Exception as e:
+            self.logger.error(f"RabbitMQ publisher stopped: {e}")
+        finally:
+            self.rabbitmq_channel = None
+            # Nothing will publish these any more - keep them in the local log
+            while True:
+                try:
+                    message = self._publish_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.logger.error(f"Unpublished message:\n{json.dumps(message, indent=2)}")
+    
+    def _call_threadsafe(self, callback):
+        """Run callback on the publisher's I/O loop thread
+        
+        pika connections are not thread-safe, so every pika call made on
+        behalf of the scanner threads must be marshalled through here.
+        """
+        connection = self.rabbitmq_connection
+        if connection is None or connection.is_closed:
+            return False
+        connection.ioloop.add_callback_threadsafe(callback)
+        return True
+    
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+    
+    def _on_channel_closed(self, channel, reason):
+        self.rabbitmq_channel = None
+        if self.running.is_set():
+            self.logger.error(f"RabbitMQ channel closed: {reason}")
+        if not self.rabbitmq_connection.is_closing and not self.rabbitmq_connection.is_closed:
+            self.rabbitmq_connection.close()
+    
+    def _on_connection_closed(self, connection, reason):
+        self.rabbitmq_channel = None
+        if self.running.is_set():
+            self.logger.error(f"RabbitMQ connection closed: {reason}")
+        connection.ioloop.stop()
+    
+    def _on_channel_open(self, channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=self._on_confirm)
+        self.rabbitmq_channel = channel
+        self._channel_ready.set()
+        self._flush_publish_queue()
+    
+    def _flush_publish_queue(self):
+        """Periodic batch flush - reschedules itself on the I/O loop"""
+        if not self.rabbitmq_channel:
+            return
+        self._drain_publish_queue()
+        self.rabbitmq_connection.ioloop.call_later(self.PUBLISH_INTERVAL, self._flush_publish_queue)
+    
+    def _on_confirm(self, frame):
+        """Handle broker acks/nacks for published messages"""
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+        
+        nacked = isinstance(method, pika.spec.Basic.Nack)
+        for tag in tags:
+            message = self._unconfirmed.pop(tag, None)
+            if nacked and message:
+                self.logger.error(f"RabbitMQ NACK: {message['object_code']} at {message['location_code']}")
+    
+    def _drain_publish_queue(self):
+        """Publish everything queued by the scanner - runs on the I/O loop"""
+        channel = self.rabbitmq_channel
+        if not channel:
+            return
+        
+        rabbitmq_config = self.config['rabbitmq']
+        while True:
+            try:
+                message = self._publish_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            channel.basic_publish(
+                exchange=rabbitmq_config['exchange'],
+                routing_key=rabbitmq_config['routing_key_scan'],
+                body=encode_message(message),
+                properties=pika.BasicProperties(
+                    delivery_mode=2,  # Persistent
+                    timestamp=int(time.time())
+                )
+            )
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = message
+    
     def capture_frame(self):
         """Capture frame from camera"""
         if not self.picam2:
             return False, None
         
         try:
+            if MappedArray is not None:
+                # Copy only the Y plane straight out of the mapped camera
+                # buffer and hand the buffer back to the camera immediately
+                request = self.picam2.capture_request()
+                try:
+                    with MappedArray(request, "main") as mapped:
+                        return True, mapped.array[:480, :640].copy()
+                finally:
+                    request.release()
+            
             frame = self.picam2.capture_array()
             if frame is not None and frame.size > 0:
-                # Convert RGB to BGR for OpenCV
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                return True, frame_bgr
+                # YUV420 - the Y plane is the first 480 rows, already grayscale
+                return True, frame[:480, :640]
             return False, None
         except Exception as e:
             self.logger.error(f"Frame capture failed: {e}")
             return False, None
     
+    def _opencl_resize_is_faster(self, gray, runs=20):
+        """Benchmark the downscale on CPU vs OpenCL (T-API) and pick the faster one"""
+        try:
+            if not cv2.ocl.haveOpenCL():
+                return False
+            cv2.ocl.setUseOpenCL(True)
+            
+            def timed(resize):
+                resize()  # warm-up (OpenCL kernel compile)
+                start = time.perf_counter()
+                for _ in range(runs):
+                    resize()
+                return time.perf_counter() - start
+            
+            cpu = timed(lambda: cv2.resize(gray, self.SCAN_SIZE, interpolation=cv2.INTER_AREA))
+            gpu = timed(lambda: cv2.resize(cv2.UMat(gray), self.SCAN_SIZE, interpolation=cv2.INTER_AREA).get())
+            print(f"Downscale benchmark: CPU {cpu * 1000 / runs:.2f} ms, OpenCL {gpu * 1000 / runs:.2f} ms")
+            return gpu < cpu
+        except Exception as e:
+            self.logger.warning(f"OpenCL benchmark failed: {e}")
+            return False
+    
     def decode_qr_codes(self, frame):
         """Decode QR codes from frame"""
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            height, width = frame.shape[:2]
+            if width > self.SCAN_SIZE[0] and self._miss_count < self.FULL_RES_AFTER_MISSES:
+                if self._use_opencl:
+                    gray = cv2.resize(cv2.UMat(frame), self.SCAN_SIZE, interpolation=cv2.INTER_AREA).get()
+                else:
+                    gray = cv2.resize(frame, self.SCAN_SIZE, dst=self._scan_buf, interpolation=cv2.INTER_AREA)
+                scale = width / self.SCAN_SIZE[0]
+            else:
+                gray = frame
+                scale = 1.0
+            
+            # Skip pyzbar entirely on blurred/featureless frames
+            if laplacian_variance(gray) < self.SHARPNESS_THRESHOLD:
+                return []
+            
             qr_codes = pyzbar.decode(gray)
+            if qr_codes:
+                self._miss_count = 0
+                if scale != 1.0:
+                    qr_codes = [self._scale_qr_code(qr, scale) for qr in qr_codes]
+            else:
+                # A full-res miss starts the small-frame run over
+                self._miss_count = self._miss_count + 1 if scale != 1.0 else 0
             return qr_codes
         except Exception as e:
             self.logger.error(f"QR decode failed: {e}")
             return []
     
+    def _scale_qr_code(self, qr_code, scale):
+        """Map a QR code found on a downscaled frame back to full-frame coordinates"""
+        rect = Rect(*(int(round(value * scale)) for value in qr_code.rect))
+        polygon = [Point(int(round(p.x * scale)), int(round(p.y * scale))) for p in qr_code.polygon]
+        return qr_code._replace(rect=rect, polygon=polygon)
+    
+    def _process_object_fast(self, qr_bytes):
+        """Steady-state path once a location is set: objects only, no location lookup"""
+        object_key = self._obj_bytes.get(qr_bytes)
+        if object_key is None:
+            return self.process_qr_bytes(qr_bytes)
+        
+        try:
+            return self._record_object(object_key)
+        except Exception as e:
+            self.logger.error(f"Error processing QR code {qr_bytes}: {e}")
+            return None
+    
+    def process_qr_bytes(self, qr_bytes):
+        """Process raw QR payload bytes - exact config keys skip decode/normalize"""
+        try:
+            location = self._loc_bytes.get(qr_bytes)
+            if location:
+                return self._set_location(*location)
+            
+            object_key = self._obj_bytes.get(qr_bytes)
+            if object_key:
+                return self._scan_object(object_key)
+            
+            # Not an exact key - fall back to the normalized lookup
+            qr_data = qr_bytes.decode('utf-8')
+        
+        except Exception as e:
+            self.logger.error(f"Error processing QR code {qr_bytes}: {e}")
+            return None
+        
+        return self.process_qr_code(qr_data)
+    
     def process_qr_code(self, qr_data):
         """Process detected QR code and handle location/object logic"""
         try:
             # Normalize the QR data - remove whitespace and convert to uppercase
             qr_data_normalized = qr_data.strip().upper()
-        
-            print(f"\n--- Processing QR Code: '{qr_data}' (normalized: '{qr_data_normalized}') ---")
-        
-            # Check if it's a location QR code
-            locations = self.config['qr_codes']['locations']
-        
-            # Check both original and normalized versions
-            location_key = None
-            if qr_data in locations:
-                location_key = qr_data
-            elif qr_data_normalized in locations:
-                location_key = qr_data_normalized
-        
-            if location_key:
-                self.current_location = location_key
-                location_info = locations[location_key]
-            
-                # Handle both dictionary and string formats safely
-                if isinstance(location_info, dict):
-                    description = location_info.get('description', location_info.get('name', location_key))
-                else:
-                    description = str(location_info)
             
-                print(f"✓ LOCATION SET: {location_key} - {description}")
-                print(f"DEBUG: location_info type: {type(location_info)}")
-                print(f"DEBUG: location_info content: {location_info}")
-                self.logger.info(f"Location updated to: {location_key} - {description}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Processing QR Code: '{qr_data}' (normalized: '{qr_data_normalized}')")
+            
+            # Check if it's a location QR code
+            location = self._locations.get(qr_data_normalized)
+            if location:
+                return self._set_location(*location)
             
-                return {
-                    'type': 'location',
-                    'code': location_key,
-                    'description': description
-                }
-        
             # Check if it's an object QR code
-            objects = self.config['qr_codes']['objects']
-        
-            # Check both original and normalized versions
-            object_key = None
-            if qr_data in objects:
-                object_key = qr_data
-            elif qr_data_normalized in objects:
-                object_key = qr_data_normalized
-        
+            object_key = self._obj_map.get(qr_data_normalized)
             if object_key:
-                object_info = objects[object_key]
+                return self._scan_object(object_key)
             
-                if self.current_location:
-                    # Create and send message
-                    message = self.create_scan_message(object_key, self.current_location)
-                    success = self.send_rabbitmq_message(message)
-                
-                    print(f"✓ OBJECT SCANNED: {object_key} at location {self.current_location}")
-                    print(f"✓ MESSAGE SENT: {'RabbitMQ' if success else 'Local Log'}")
-                
-                    return {
-                        'type': 'object',
-                        'code': object_key,
-                        'object_info': object_info,
-                        'location': self.current_location,
-                        'message_sent': success
-                    }
-                else:
-                    print(f"⚠ OBJECT DETECTED: {object_key} but NO LOCATION SET")
-                    print("Please scan a location QR code first")
-                    return {
-                        'type': 'object_no_location',
-                        'code': object_key,
-                        'object_info': object_info
-                    }
-        
             # Unknown QR code
-            print(f"? UNKNOWN QR CODE: '{qr_data}' (normalized: '{qr_data_normalized}')")
-            print(f"Available locations: {list(locations.keys())}")
-            print(f"Available objects: {list(objects.keys())}")
+            self.logger.info(f"Unknown QR code: '{qr_data}' (normalized: '{qr_data_normalized}')")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(self._available_locations)
+                self.logger.debug(self._available_objects)
             return None
         
         except Exception as e:
-            print(f"ERROR processing QR code: {e}")
             self.logger.error(f"Error processing QR code {qr_data}: {e}")
             return None
     
+    def _set_location(self, location_key, description):
+        """Make location_key the current location"""
+        self.current_location = location_key
+        self._state_obj_mode = True
+        
+        self.logger.info(f"Location updated to: {location_key} - {description}")
+        
+        return {
+            'type': 'location',
+            'code': location_key,
+            'description': description
+        }
+    
+    def _scan_object(self, object_key):
+        """Record object_key at the current location"""
+        if self.current_location:
+            return self._record_object(object_key)
+        else:
+            object_info = self.config['qr_codes']['objects'][object_key]
+            self.logger.warning(f"Object {object_key} detected but no location set - scan a location QR code first")
+            return {
+                'type': 'object_no_location',
+                'code': object_key,
+                'object_info': object_info
+            }
+    
+    def _record_object(self, object_key):
+        """Send a scan message for object_key at the current location"""
+        message = self.create_scan_message(object_key, self.current_location)
+        success = self.send_rabbitmq_message(message)
+        
+        self.logger.info(f"Object scanned: {object_key} at location {self.current_location} "
+                         f"({'RabbitMQ' if success else 'Local Log'})")
+        
+        return {
+            'type': 'object',
+            'code': object_key,
+            'object_info': message['object_info'],
+            'location': self.current_location,
+            'message_sent': success
+        }
+    
     def create_scan_message(self, object_code, location_code):
         """Create message for RabbitMQ"""
         message = {
             'timestamp': datetime.now().isoformat(),
-            'scanner_id': f"bookworm_pi_{self.get_device_id()}",
+            'scanner_id': self._scanner_id,
             'object_code': object_code,
             'object_info': self.config['qr_codes']['objects'].get(object_code, {}),
             'location_code': location_code,
@@ -316,11 +636,10 @@ class CompleteBookwormScanner:
             'source': 'bookworm_qr_scanner'
         }
         
-        print(f"Created message: {object_code} -> {location_code}")
         return message
     
-    def get_device_id(self):
-        """Get device identifier"""
+    def _read_device_id(self):
+        """Read the device identifier - called once at startup"""
         try:
             with open('/proc/cpuinfo', 'r') as f:
                 for line in f:
@@ -334,44 +653,36 @@ class CompleteBookwormScanner:
         """Send message to RabbitMQ or log locally"""
         try:
             if self.rabbitmq_channel:
-                rabbitmq_config = self.config['rabbitmq']
+                # Hand off to the publisher thread - confirms arrive asynchronously.
+                # The timer flushes small batches; only wake it early for a full one.
+                self._publish_queue.put(message)
+                if self._publish_queue.qsize() >= self.PUBLISH_BATCH_SIZE:
+                    self._call_threadsafe(self._drain_publish_queue)
                 
-                self.rabbitmq_channel.basic_publish(
-                    exchange=rabbitmq_config['exchange'],
-                    routing_key=rabbitmq_config['routing_key_scan'],
-                    body=json.dumps(message, indent=2),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,  # Persistent
-                        timestamp=int(time.time())
-                    )
-                )
-                
-                print(f"📤 RabbitMQ Message Sent Successfully")
                 self.logger.info(f"RabbitMQ: {message['object_code']} at {message['location_code']}")
                 return True
             else:
-                print("📝 LOCAL MODE - Message logged:")
-                print(json.dumps(message, indent=2))
-                self.logger.info(f"LOCAL: {message['object_code']} at {message['location_code']}")
+                self.logger.info(f"LOCAL: {message['object_code']} at {message['location_code']}\n"
+                                 f"{json.dumps(message, indent=2)}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Message sending failed: {e}")
-            print("📝 Logging message locally:")
-            print(json.dumps(message, indent=2))
-            self.logger.error(f"Message send failed: {e}")
+            self.logger.error(f"Message send failed: {e}\n{json.dumps(message, indent=2)}")
             return False
     
-    def is_duplicate_scan(self, qr_data):
-        """Check for duplicate scans"""
-        current_time = time.time()
-        window = self.config['processing_rules']['duplicate_scan_window_seconds']
+    def is_duplicate_scan(self, qr_bytes):
+        """Check for duplicate scans, keyed on the raw QR payload bytes"""
+        current_time = time.monotonic()
         
-        if qr_data in self.last_scans:
-            if current_time - self.last_scans[qr_data] < window:
-                return True
+        last_seen = self.last_scans.get(qr_bytes)
+        if last_seen is not None and current_time - last_seen < self._dup_window:
+            return True
         
-        self.last_scans[qr_data] = current_time
+        if len(self.last_scans) >= self.MAX_TRACKED_SCANS:
+            self.last_scans = {k: v for k, v in self.last_scans.items()
+                               if current_time - v < self._dup_window}
+        
+        self.last_scans[qr_bytes] = current_time
         return False
     
     def run(self):
@@ -392,63 +703,109 @@ class CompleteBookwormScanner:
         print(f"\n🎯 SCANNER READY!")
         print(f"📍 Current location: {self.current_location or 'Not set - scan a location QR first'}")
         print(f"🔗 RabbitMQ: {'Connected' if self.rabbitmq_channel else 'Local mode'}")
-        print(f"⏱️  Duplicate scan window: {self.config['processing_rules']['duplicate_scan_window_seconds']}s")
+        print(f"⏱️  Duplicate scan window: {self._dup_window}s")
         print("\nHold QR codes in front of camera...")
         print("Press Ctrl+C to stop\n")
         
-        frame_count = 0
-        qr_count = 0
-        message_count = 0
-        last_status = time.time()
+        capture_thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
+        decode_thread = threading.Thread(target=self._decode_loop, name="decode", daemon=True)
         
         try:
-            while self.running:
-                # Capture frame
-                ret, frame = self.capture_frame()
-                if not ret or frame is None:
-                    time.sleep(0.1)
+            capture_thread.start()
+            decode_thread.start()
+            # Keep the main thread free to receive Ctrl+C
+            while decode_thread.is_alive():
+                decode_thread.join(0.5)
+                
+        except KeyboardInterrupt:
+            print("\n🛑 Stopping scanner...")
+        except Exception as e:
+            print(f"❌ Scanner error: {e}")
+        finally:
+            self.running.clear()
+            capture_thread.join(timeout=2)
+            decode_thread.join(timeout=2)
+            self.cleanup()
+            print(f"\n📊 FINAL STATS: {self.qr_count} QR codes processed, {self.message_count} messages sent")
+            return True
+    
+    def _capture_loop(self):
+        """Capture frames and hand the newest one to the decode thread"""
+        while self.running.is_set():
+            ret, frame = self.capture_frame()
+            if not ret or frame is None:
+                time.sleep(0.1)
+                continue
+            
+            item = (time.monotonic(), frame)
+            try:
+                self._frames.put_nowait(item)
+            except queue.Full:
+                # Drop the stale frame - decode only ever wants the latest
+                try:
+                    self._frames.get_nowait()
+                except queue.Empty:
+                    pass
+                self._frames.put_nowait(item)
+    
+    def _decode_loop(self):
+        """Decode queued frames, process QR codes and render the preview"""
+        last_status = time.monotonic()
+        preview = len(sys.argv) > 1 and sys.argv[1] == "--preview"
+        
+        try:
+            while self.running.is_set():
+                try:
+                    _, frame = self._frames.get(timeout=0.5)
+                except queue.Empty:
                     continue
                 
-                frame_count += 1
+                self.frame_count += 1
                 
                 # Decode QR codes
                 qr_codes = self.decode_qr_codes(frame)
                 
                 # Process each QR code
                 for qr_code in qr_codes:
-                    qr_data = qr_code.data.decode('utf-8')
+                    raw = qr_code.data
                     
-                    # Skip duplicates
-                    if self.is_duplicate_scan(qr_data):
-                        print(f"⏭️  Duplicate scan skipped: {qr_data}")
+                    # Skip duplicates before paying for the UTF-8 decode
+                    if self.is_duplicate_scan(raw):
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            self.logger.debug(f"Duplicate scan skipped: {raw}")
                         continue
                     
                     # Process QR code
-                    result = self.process_qr_code(qr_data)
+                    if self._state_obj_mode:
+                        result = self._process_object_fast(raw)
+                    else:
+                        result = self.process_qr_bytes(raw)
                     if result:
-                        qr_count += 1
+                        self.qr_count += 1
                         if result.get('message_sent'):
-                            message_count += 1
+                            self.message_count += 1
                 
                 # Status update every 30 seconds
-                current_time = time.time()
+                current_time = time.monotonic()
                 if current_time - last_status > 30:
-                    print(f"\n📊 STATUS: {frame_count} frames | {qr_count} QR codes | {message_count} messages sent")
+                    print(f"\n📊 STATUS: {self.frame_count} frames | {self.qr_count} QR codes | {self.message_count} messages sent")
                     print(f"📍 Current location: {self.current_location or 'Not set'}")
                     last_status = current_time
                 
                 # Preview mode
-                if len(sys.argv) > 1 and sys.argv[1] == "--preview":
+                if preview:
+                    # Only frames with hits need colour for the green outlines
+                    if qr_codes:
+                        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=self._preview_buf)
                     for qr_code in qr_codes:
                         points = qr_code.polygon
                         if len(points) >= 4:
                             try:
-                                pts = [(p.x, p.y) for p in points]
-                                for i in range(len(pts)):
-                                    cv2.line(frame, pts[i], pts[(i+1) % len(pts)], (0, 255, 0), 2)
+                                pts = np.asarray([(p.x, p.y) for p in points], dtype=np.int32)
+                                cv2.polylines(frame, [pts], isClosed=True, color=(0, 255, 0), thickness=2)
                                 # Add QR data as text
                                 qr_text = qr_code.data.decode('utf-8')
-                                cv2.putText(frame, qr_text, (pts[0][0], pts[0][1]-10), 
+                                cv2.putText(frame, qr_text, (int(pts[0][0]), int(pts[0][1])-10), 
                                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
                             except:
                                 pass
@@ -461,21 +818,15 @@ class CompleteBookwormScanner:
                     if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
                 
-                time.sleep(0.05)  # 20 FPS
-                
-        except KeyboardInterrupt:
-            print("\n🛑 Stopping scanner...")
         except Exception as e:
-            print(f"❌ Scanner error: {e}")
+            print(f"❌ Decode error: {e}")
         finally:
-            self.cleanup()
-            print(f"\n📊 FINAL STATS: {qr_count} QR codes processed, {message_count} messages sent")
-            return True
+            self.running.clear()
     
     def cleanup(self):
         """Cleanup resources"""
         print("🧹 Cleaning up...")
-        self.running = False
+        self.running.clear()
         
         if self.picam2:
             try:
@@ -487,7 +838,12 @@ class CompleteBookwormScanner:
         
         if self.rabbitmq_connection and not self.rabbitmq_connection.is_closed:
             try:
-                self.rabbitmq_connection.close()
+                # Flush queued messages, then close on the connection's own thread
+                self._call_threadsafe(self._drain_publish_queue)
+                self._call_threadsafe(self.rabbitmq_connection.close)
+                self._publisher_thread.join(timeout=5)
+                if self._unconfirmed:
+                    print(f"⚠ {len(self._unconfirmed)} messages not confirmed by RabbitMQ")
                 print("🔗 RabbitMQ disconnected")
             except:
                 pass
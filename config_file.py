@@ -90,6 +90,7 @@
         "qr_detection_timeout": 5,
         "max_retry_attempts": 3,
         "log_level": "INFO",
+        "log_file": "/var/log/qr_scanner.log",
         "enable_preview": False
     },
     "processing_rules": {
@@ -7,26 +7,124 @@ Additional service for handling database operations, audit trails, and reporting
 import json
 import sqlite3
 import logging
-import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import signal
 import sys
 import threading
-import schedule
+import queue
+from collections import Counter
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 import requests
 from contextlib import contextmanager
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def dumps_json(data: Any) -> str:
+    """Serialize to a JSON string, with orjson when it is installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(',', ':'))
+
+# Applied to every connection; journal_mode=WAL is persistent and is set
+# once in initialize_database
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Read-only connections kept open alongside the single writer
+READ_POOL_SIZE = 4
+
+# Hot-path statements, kept as constants so sqlite3's statement cache
+# sees the identical SQL text on every call
+INSERT_SCAN_SQL = """
+    INSERT INTO asset_locations (
+        object_code, object_name, object_type, object_serial, object_owner,
+        location_code, location_description, scanner_id, scan_timestamp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_POSITION_SQL = """
+    INSERT INTO current_asset_positions (
+        object_code, object_name, object_type, object_serial, object_owner,
+        current_location_code, current_location_description, last_scanner_id,
+        last_scan_timestamp, first_seen, total_moves
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT(object_code) DO UPDATE SET
+        object_name = excluded.object_name,
+        object_type = excluded.object_type,
+        object_serial = excluded.object_serial,
+        object_owner = excluded.object_owner,
+        current_location_code = excluded.current_location_code,
+        current_location_description = excluded.current_location_description,
+        last_scanner_id = excluded.last_scanner_id,
+        last_scan_timestamp = excluded.last_scan_timestamp,
+        last_updated = CURRENT_TIMESTAMP,
+        total_moves = total_moves + 1
+"""
+
+INSERT_AUDIT_SQL = """
+    INSERT INTO audit_trail (
+        object_code, event_type, old_location_code, new_location_code,
+        scanner_id, timestamp, details
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPDATE_STATUS_SQL = """
+    UPDATE asset_locations
+    SET processing_status = ?, ies4_updated = ?, solr_updated = ?,
+        processed_timestamp = CURRENT_TIMESTAMP
+    WHERE object_code = ? AND scan_timestamp = ?
+"""
+
+ASSET_HISTORY_SQL = """
+    SELECT * FROM asset_locations
+    WHERE object_code = ? AND scan_timestamp >= datetime('now', ?)
+    ORDER BY scan_timestamp DESC
+"""
+
+LOCATION_CONTENTS_SQL = """
+    SELECT * FROM current_asset_positions
+    WHERE current_location_code = ?
+    ORDER BY last_scan_timestamp DESC
+"""
+
+# queue_asset_scan writes a batch at this many scans or after this many seconds
+SCAN_BATCH_SIZE = 50
+SCAN_FLUSH_INTERVAL = 0.1
+
+# Rows fetched per round trip when streaming query results
+FETCH_BATCH_SIZE = 1000
+
+# cleanup_old_data deletes old scans in chunks of this many rows, committing
+# between chunks so the WAL stays small and scan writes are not held off
+CLEANUP_CHUNK_SIZE = 5000
+
+DELETE_OLD_SCANS_SQL = """
+    DELETE FROM asset_locations WHERE rowid IN (
+        SELECT rowid FROM asset_locations
+        WHERE processing_status = 'success' AND scan_timestamp < ?
+        LIMIT ?
+    )
+"""
+
 class DatabaseUpdateService:
     def __init__(self, config_file: str = 'config.json', db_file: str = 'asset_tracking.db'):
         """Initialize the Database Update Service"""
-        self.config = self.load_config(config_file)
-        self.db_file = db_file
-        self.running = True
-        
-        # Setup logging
+        # Setup logging first so config errors can be reported; the
+        # configured level is applied once the config has loaded
         logging.basicConfig(
-            level=getattr(logging, self.config['scanner_settings']['log_level']),
+            level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
                 logging.FileHandler('/var/log/database_updater.log'),
@@ -35,6 +133,25 @@ class DatabaseUpdateService:
         )
         self.logger = logging.getLogger(__name__)
         
+        self.config = self.load_config(config_file)
+        logging.getLogger().setLevel(self.config['scanner_settings']['log_level'])
+        self.db_file = db_file
+        self.running = True
+        self._stop = threading.Event()
+        
+        # Connection pool: one writer serialized by a lock, plus readers
+        # opened on demand (WAL allows them to run during writes)
+        self._write_lock = threading.Lock()
+        self._write_conn = None
+        self._pool_lock = threading.Lock()
+        self._read_pool = queue.Queue()
+        self._read_conns = []
+        
+        # Scans buffered by queue_asset_scan
+        self._scan_buffer = []
+        self._scan_buffer_lock = threading.Lock()
+        self._scan_flush_timer = None
+        
         # Initialize database
         self.initialize_database()
         
@@ -61,6 +178,9 @@ class DatabaseUpdateService:
         """Initialize SQLite database with required tables"""
         try:
             with self.get_db_connection() as conn:
+                # WAL lets readers run alongside the writer; stored in the file header
+                conn.execute("PRAGMA journal_mode=WAL")
+                
                 cursor = conn.cursor()
                 
                 # Create tables
@@ -144,114 +264,193 @@ class DatabaseUpdateService:
                     CREATE INDEX IF NOT EXISTS idx_current_positions_location ON current_asset_positions(current_location_code);
                     CREATE INDEX IF NOT EXISTS idx_audit_trail_object ON audit_trail(object_code);
                     CREATE INDEX IF NOT EXISTS idx_audit_trail_timestamp ON audit_trail(timestamp);
+                    
+                    -- Composite indexes matching the history, report and cleanup queries
+                    CREATE INDEX IF NOT EXISTS idx_asset_locations_obj_ts ON asset_locations(object_code, scan_timestamp DESC);
+                    CREATE INDEX IF NOT EXISTS idx_asset_locations_ts_loc ON asset_locations(scan_timestamp, location_code, object_code);
+                    CREATE INDEX IF NOT EXISTS idx_asset_locations_status_ts ON asset_locations(processing_status, scan_timestamp);
                 """)
                 
                 conn.commit()
+                
+                # Refresh planner statistics so the new indexes get picked
+                cursor.execute("ANALYZE")
                 self.logger.info("Database initialized successfully")
                 
         except Exception as e:
             self.logger.error(f"Failed to initialize database: {e}")
             sys.exit(1)
     
-    @contextmanager
-    def get_db_connection(self):
-        """Get database connection with context manager"""
-        conn = None
+    def _open_connection(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a pooled connection and apply the per-connection PRAGMAs"""
+        # Writes open with BEGIN IMMEDIATE so the write lock is taken up front
+        # rather than upgraded mid-transaction, which can fail with SQLITE_BUSY
+        conn = sqlite3.connect(self.db_file, timeout=30.0, check_same_thread=False,
+                               cached_statements=256,
+                               isolation_level=None if readonly else 'IMMEDIATE')
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only=true")
+        return conn
+    
+    def _checkout_reader(self) -> sqlite3.Connection:
+        """Take a reader from the pool, opening one if the pool is not full yet"""
         try:
-            conn = sqlite3.connect(self.db_file, timeout=30.0)
-            conn.row_factory = sqlite3.Row
-            yield conn
-        except Exception as e:
-            if conn:
+            return self._read_pool.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._pool_lock:
+            if len(self._read_conns) < READ_POOL_SIZE:
+                conn = self._open_connection(readonly=True)
+                self._read_conns.append(conn)
+                return conn
+        return self._read_pool.get()
+    
+    @contextmanager
+    def get_db_connection(self, readonly: bool = False):
+        """Check out a pooled database connection with context manager"""
+        if readonly:
+            conn = self._checkout_reader()
+            try:
+                yield conn
+            finally:
+                self._read_pool.put(conn)
+            return
+        
+        with self._write_lock:
+            if self._write_conn is None:
+                self._write_conn = self._open_connection()
+            conn = self._write_conn
+            try:
+                yield conn
+            except Exception:
                 conn.rollback()
-            raise e
-        finally:
-            if conn:
-                conn.close()
+                raise
     
     def record_asset_scan(self, scan_data: Dict[str, Any]) -> bool:
         """Record a new asset scan"""
+        return self.record_asset_scans([scan_data])
+    
+    def record_asset_scans(self, scans: List[Dict[str, Any]]) -> bool:
+        """Record a batch of asset scans in a single transaction"""
+        if not scans:
+            return True
+        
         try:
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Insert scan record
-                cursor.execute("""
-                    INSERT INTO asset_locations (
-                        object_code, object_name, object_type, object_serial, object_owner,
-                        location_code, location_description, scanner_id, scan_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    scan_data['object_code'],
-                    scan_data.get('object_info', {}).get('name'),
-                    scan_data.get('object_info', {}).get('type'),
-                    scan_data.get('object_info', {}).get('serial'),
-                    scan_data.get('object_info', {}).get('owner'),
-                    scan_data['location_code'],
-                    scan_data.get('location_info'),
-                    scan_data.get('scanner_id'),
-                    scan_data['timestamp']
+                # Insert scan records
+                cursor.executemany(INSERT_SCAN_SQL, (
+                    (
+                        scan['object_code'],
+                        scan.get('object_info', {}).get('name'),
+                        scan.get('object_info', {}).get('type'),
+                        scan.get('object_info', {}).get('serial'),
+                        scan.get('object_info', {}).get('owner'),
+                        scan['location_code'],
+                        scan.get('location_info'),
+                        scan.get('scanner_id'),
+                        scan['timestamp']
+                    ) for scan in scans
                 ))
                 
-                # Get previous location for audit trail
-                cursor.execute("""
-                    SELECT current_location_code FROM current_asset_positions 
-                    WHERE object_code = ?
-                """, (scan_data['object_code'],))
-                
-                result = cursor.fetchone()
-                old_location = result['current_location_code'] if result else None
-                
-                # Update current position
-                cursor.execute("""
-                    INSERT OR REPLACE INTO current_asset_positions (
-                        object_code, object_name, object_type, object_serial, object_owner,
-                        current_location_code, current_location_description, last_scanner_id,
-                        last_scan_timestamp, first_seen, total_moves
-                    ) VALUES (
-                        ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                        COALESCE((SELECT first_seen FROM current_asset_positions WHERE object_code = ?), ?),
-                        COALESCE((SELECT total_moves FROM current_asset_positions WHERE object_code = ?) + 1, 1)
-                    )
-                """, (
-                    scan_data['object_code'],
-                    scan_data.get('object_info', {}).get('name'),
-                    scan_data.get('object_info', {}).get('type'),
-                    scan_data.get('object_info', {}).get('serial'),
-                    scan_data.get('object_info', {}).get('owner'),
-                    scan_data['location_code'],
-                    scan_data.get('location_info'),
-                    scan_data.get('scanner_id'),
-                    scan_data['timestamp'],
-                    scan_data['object_code'], scan_data['timestamp'],
-                    scan_data['object_code']
+                # Get previous locations for the audit trail in one query
+                object_codes = list({scan['object_code'] for scan in scans})
+                current_locations = {}
+                for i in range(0, len(object_codes), 500):
+                    chunk = object_codes[i:i + 500]
+                    cursor.execute(f"""
+                        SELECT object_code, current_location_code FROM current_asset_positions 
+                        WHERE object_code IN ({','.join('?' * len(chunk))})
+                    """, chunk)
+                    current_locations.update(cursor.fetchall())
+                
+                # Location changes, in scan order so repeats within the batch chain
+                audit_rows = []
+                for scan in scans:
+                    old_location = current_locations.get(scan['object_code'])
+                    if old_location != scan['location_code']:
+                        audit_rows.append((
+                            scan['object_code'],
+                            'location_change',
+                            old_location,
+                            scan['location_code'],
+                            scan.get('scanner_id'),
+                            scan['timestamp'],
+                            dumps_json(scan)
+                        ))
+                    current_locations[scan['object_code']] = scan['location_code']
+                
+                # Update current positions
+                cursor.executemany(UPSERT_POSITION_SQL, (
+                    (
+                        scan['object_code'],
+                        scan.get('object_info', {}).get('name'),
+                        scan.get('object_info', {}).get('type'),
+                        scan.get('object_info', {}).get('serial'),
+                        scan.get('object_info', {}).get('owner'),
+                        scan['location_code'],
+                        scan.get('location_info'),
+                        scan.get('scanner_id'),
+                        scan['timestamp'],
+                        scan['timestamp']
+                    ) for scan in scans
                 ))
                 
-                # Record audit trail if location changed
-                if old_location != scan_data['location_code']:
-                    cursor.execute("""
-                        INSERT INTO audit_trail (
-                            object_code, event_type, old_location_code, new_location_code,
-                            scanner_id, timestamp, details
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        scan_data['object_code'],
-                        'location_change',
-                        old_location,
-                        scan_data['location_code'],
-                        scan_data.get('scanner_id'),
-                        scan_data['timestamp'],
-                        json.dumps(scan_data)
-                    ))
+                # Record audit trail for location changes
+                if audit_rows:
+                    cursor.executemany(INSERT_AUDIT_SQL, audit_rows)
                 
                 conn.commit()
-                self.logger.info(f"Recorded scan for {scan_data['object_code']}")
+                if len(scans) == 1:
+                    self.logger.info(f"Recorded scan for {scans[0]['object_code']}")
+                else:
+                    self.logger.info(f"Recorded {len(scans)} scans")
                 return True
                 
         except Exception as e:
             self.logger.error(f"Error recording asset scan: {e}")
             return False
     
+    def queue_asset_scan(self, scan_data: Dict[str, Any]):
+        """Buffer a scan; the buffer is written when it fills or after SCAN_FLUSH_INTERVAL"""
+        with self._scan_buffer_lock:
+            self._scan_buffer.append(scan_data)
+            if len(self._scan_buffer) >= SCAN_BATCH_SIZE:
+                flush_now = True
+            else:
+                flush_now = False
+                if self._scan_flush_timer is None:
+                    self._scan_flush_timer = threading.Timer(SCAN_FLUSH_INTERVAL, self.flush_asset_scans)
+                    self._scan_flush_timer.daemon = True
+                    self._scan_flush_timer.start()
+        
+        if flush_now:
+            self.flush_asset_scans()
+    
+    def flush_asset_scans(self) -> bool:
+        """Write any buffered scans in one batch"""
+        with self._scan_buffer_lock:
+            scans, self._scan_buffer = self._scan_buffer, []
+            if self._scan_flush_timer is not None:
+                self._scan_flush_timer.cancel()
+                self._scan_flush_timer = None
+        
+        if self.record_asset_scans(scans):
+            return True
+        if len(scans) == 1:
+            return False
+        
+        # One bad scan rolls back the whole batch - retry one at a time so
+        # only the bad ones are lost
+        rejected = [scan for scan in scans if not self.record_asset_scan(scan)]
+        for scan in rejected:
+            self.logger.error(f"Dropped buffered scan: {scan}")
+        return not rejected
+    
     def update_processing_status(self, object_code: str, timestamp: str, 
                                ies4_success: bool, solr_success: bool) -> bool:
         """Update processing status for a scan"""
@@ -261,12 +460,7 @@ class DatabaseUpdateService:
                 
                 status = 'success' if (ies4_success and solr_success) else 'partial' if (ies4_success or solr_success) else 'failed'
                 
-                cursor.execute("""
-                    UPDATE asset_locations 
-                    SET processing_status = ?, ies4_updated = ?, solr_updated = ?,
-                        processed_timestamp = CURRENT_TIMESTAMP
-                    WHERE object_code = ? AND scan_timestamp = ?
-                """, (status, ies4_success, solr_success, object_code, timestamp))
+                cursor.execute(UPDATE_STATUS_SQL, (status, ies4_success, solr_success, object_code, timestamp))
                 
                 conn.commit()
                 return True
@@ -275,38 +469,45 @@ class DatabaseUpdateService:
             self.logger.error(f"Error updating processing status: {e}")
             return False
     
+    def _stream_rows(self, sql: str, params: tuple) -> Iterator[Dict[str, Any]]:
+        """Run a read query and yield rows as dicts, FETCH_BATCH_SIZE at a time
+        
+        The reader connection stays checked out until the generator is
+        exhausted or closed.
+        """
+        with self.get_db_connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = FETCH_BATCH_SIZE
+            cursor.execute(sql, params)
+            columns = [d[0] for d in cursor.description]
+            
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+    
+    def iter_asset_history(self, object_code: str, days: int = 30) -> Iterator[Dict[str, Any]]:
+        """Stream location history for an asset"""
+        return self._stream_rows(ASSET_HISTORY_SQL, (object_code, f'-{int(days)} days'))
+    
     def get_asset_history(self, object_code: str, days: int = 30) -> List[Dict[str, Any]]:
         """Get location history for an asset"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT * FROM asset_locations 
-                    WHERE object_code = ? AND scan_timestamp >= datetime('now', '-{} days')
-                    ORDER BY scan_timestamp DESC
-                """.format(days), (object_code,))
-                
-                return [dict(row) for row in cursor.fetchall()]
-                
+            return list(self.iter_asset_history(object_code, days))
         except Exception as e:
             self.logger.error(f"Error getting asset history: {e}")
             return []
     
+    def iter_location_contents(self, location_code: str) -> Iterator[Dict[str, Any]]:
+        """Stream all assets currently at a location"""
+        return self._stream_rows(LOCATION_CONTENTS_SQL, (location_code,))
+    
     def get_location_contents(self, location_code: str) -> List[Dict[str, Any]]:
         """Get all assets currently at a location"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT * FROM current_asset_positions 
-                    WHERE current_location_code = ?
-                    ORDER BY last_scan_timestamp DESC
-                """, (location_code,))
-                
-                return [dict(row) for row in cursor.fetchall()]
-                
+            return list(self.iter_location_contents(location_code))
         except Exception as e:
             self.logger.error(f"Error getting location contents: {e}")
             return []
@@ -317,61 +518,77 @@ class DatabaseUpdateService:
             if not date:
                 date = datetime.now().strftime('%Y-%m-%d')
             
-            with self.get_db_connection() as conn:
+            # Half-open [date, next day) range so the scan_timestamp index is used
+            next_day = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            day_range = (date, next_day)
+            
+            with self.get_db_connection(readonly=True) as conn:
                 cursor = conn.cursor()
                 
-                # Get daily statistics
+                # One pass over the day's rows, grouped finely enough that the
+                # statistics and both top-10 lists can be rolled up from it
                 cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_scans,
-                        COUNT(DISTINCT object_code) as unique_objects,
-                        COUNT(DISTINCT location_code) as unique_locations,
+                    SELECT location_code, location_description, object_code, object_name,
+                        COUNT(*) as scan_count,
                         SUM(CASE WHEN processing_status = 'success' THEN 1 ELSE 0 END) as successful_updates,
                         SUM(CASE WHEN processing_status IN ('failed', 'partial') THEN 1 ELSE 0 END) as failed_updates
                     FROM asset_locations 
-                    WHERE DATE(scan_timestamp) = ?
-                """, (date,))
-                
-                stats = dict(cursor.fetchone())
-                
-                # Get most active locations
-                cursor.execute("""
-                    SELECT location_code, location_description, COUNT(*) as scan_count
-                    FROM asset_locations 
-                    WHERE DATE(scan_timestamp) = ?
-                    GROUP BY location_code, location_description
-                    ORDER BY scan_count DESC
-                    LIMIT 10
-                """, (date,))
-                
-                active_locations = [dict(row) for row in cursor.fetchall()]
-                
-                # Get most moved objects
-                cursor.execute("""
-                    SELECT object_code, object_name, COUNT(*) as move_count
-                    FROM asset_locations 
-                    WHERE DATE(scan_timestamp) = ?
-                    GROUP BY object_code, object_name
-                    ORDER BY move_count DESC
-                    LIMIT 10
-                """, (date,))
-                
-                most_moved = [dict(row) for row in cursor.fetchall()]
-                
-                report = {
-                    'date': date,
-                    'statistics': stats,
-                    'most_active_locations': active_locations,
-                    'most_moved_objects': most_moved,
-                    'generated_at': datetime.now().isoformat()
-                }
+                    WHERE scan_timestamp >= ? AND scan_timestamp < ?
+                    GROUP BY location_code, location_description, object_code, object_name
+                """, day_range)
+                
+                location_counts = Counter()
+                object_counts = Counter()
+                successful = failed = 0
+                for loc_code, loc_desc, obj_code, obj_name, count, ok, bad in cursor:
+                    location_counts[(loc_code, loc_desc)] += count
+                    object_counts[(obj_code, obj_name)] += count
+                    successful += ok
+                    failed += bad
+                
+            stats = {
+                'total_scans': sum(location_counts.values()),
+                'unique_objects': len({code for code, _ in object_counts}),
+                'unique_locations': len({code for code, _ in location_counts}),
+                'successful_updates': successful,
+                'failed_updates': failed
+            }
+            
+            # Get most active locations
+            active_locations = [
+                {'location_code': code, 'location_description': desc, 'scan_count': count}
+                for (code, desc), count in location_counts.most_common(10)
+            ]
+            
+            # Get most moved objects
+            most_moved = [
+                {'object_code': code, 'object_name': name, 'move_count': count}
+                for (code, name), count in object_counts.most_common(10)
+            ]
+            
+            report = {
+                'date': date,
+                'statistics': stats,
+                'most_active_locations': active_locations,
+                'most_moved_objects': most_moved,
+                'generated_at': datetime.now().isoformat()
+            }
+            
+            with self.get_db_connection() as conn:
+                cursor = conn.cursor()
                 
                 # Store statistics
                 cursor.execute("""
-                    INSERT OR REPLACE INTO processing_stats (
+                    INSERT INTO processing_stats (
                         date, total_scans, successful_updates, failed_updates,
                         unique_objects, unique_locations
                     ) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(date) DO UPDATE SET
+                        total_scans = excluded.total_scans,
+                        successful_updates = excluded.successful_updates,
+                        failed_updates = excluded.failed_updates,
+                        unique_objects = excluded.unique_objects,
+                        unique_locations = excluded.unique_locations
                 """, (
                     date, stats['total_scans'], stats['successful_updates'],
                     stats['failed_updates'], stats['unique_objects'], stats['unique_locations']
@@ -389,21 +606,24 @@ class DatabaseUpdateService:
         try:
             cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).strftime('%Y-%m-%d')
             
+            # Clean up old asset_locations records (keep audit trail longer),
+            # one chunk per transaction
+            deleted_scans = 0
+            while True:
+                with self.get_db_connection() as conn:
+                    cursor = conn.execute(DELETE_OLD_SCANS_SQL, (cutoff_date, CLEANUP_CHUNK_SIZE))
+                    conn.commit()
+                deleted_scans += cursor.rowcount
+                if cursor.rowcount < CLEANUP_CHUNK_SIZE:
+                    break
+            
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Clean up old asset_locations records (keep audit trail longer)
-                cursor.execute("""
-                    DELETE FROM asset_locations 
-                    WHERE DATE(scan_timestamp) < ? AND processing_status = 'success'
-                """, (cutoff_date,))
-                
-                deleted_scans = cursor.rowcount
-                
                 # Clean up old resolved alerts
                 cursor.execute("""
                     DELETE FROM system_alerts 
-                    WHERE DATE(created_at) < ? AND resolved = 1
+                    WHERE created_at < ? AND resolved = 1
                 """, (cutoff_date,))
                 
                 deleted_alerts = cursor.rowcount
@@ -416,19 +636,25 @@ class DatabaseUpdateService:
     
     def setup_scheduler(self):
         """Setup scheduled tasks"""
+        # Jobs run on a thread pool so a long report never delays the health check
+        self.scheduler = BackgroundScheduler(
+            executors={'default': ThreadPoolExecutor(4)},
+            job_defaults={'max_instances': 1, 'coalesce': True, 'misfire_grace_time': 600}
+        )
+        
         # Daily report generation
-        schedule.every().day.at("23:59").do(self.generate_daily_report)
+        self.scheduler.add_job(self.generate_daily_report, 'cron', hour=23, minute=59)
         
         # Weekly cleanup
-        schedule.every().week.do(self.cleanup_old_data)
+        self.scheduler.add_job(self.cleanup_old_data, 'cron', day_of_week='sun')
         
         # Hourly health check
-        schedule.every().hour.do(self.health_check)
+        self.scheduler.add_job(self.health_check, 'interval', hours=1)
     
     def health_check(self):
         """Perform system health check"""
         try:
-            with self.get_db_connection() as conn:
+            with self.get_db_connection(readonly=True) as conn:
                 cursor = conn.cursor()
                 
                 # Check for recent activity
@@ -438,7 +664,7 @@ class DatabaseUpdateService:
                     WHERE scan_timestamp >= datetime('now', '-1 hour')
                 """)
                 
-                recent_scans = cursor.fetchone()['recent_scans']
+                recent_scans = cursor.fetchone()[0]
                 
                 # Check for failed processing
                 cursor.execute("""
@@ -448,10 +674,12 @@ class DatabaseUpdateService:
                     AND scan_timestamp >= datetime('now', '-1 hour')
                 """)
                 
-                failed_processing = cursor.fetchone()['failed_processing']
-                
-                # Create alerts if needed
-                if failed_processing > 5:  # More than 5 failures in an hour
+                failed_processing = cursor.fetchone()[0]
+            
+            # Create alerts if needed
+            if failed_processing > 5:  # More than 5 failures in an hour
+                with self.get_db_connection() as conn:
+                    cursor = conn.cursor()
                     cursor.execute("""
                         INSERT INTO system_alerts (alert_type, severity, message, details)
                         VALUES (?, ?, ?, ?)
@@ -459,33 +687,25 @@ class DatabaseUpdateService:
                         'processing_failure',
                         'high',
                         f'High number of processing failures: {failed_processing} in the last hour',
-                        json.dumps({'failed_count': failed_processing, 'time_window': '1 hour'})
+                        dumps_json({'failed_count': failed_processing, 'time_window': '1 hour'})
                     ))
-                
-                conn.commit()
-                self.logger.info(f"Health check completed: {recent_scans} recent scans, {failed_processing} failures")
+                    conn.commit()
+            
+            self.logger.info(f"Health check completed: {recent_scans} recent scans, {failed_processing} failures")
                 
         except Exception as e:
             self.logger.error(f"Error in health check: {e}")
     
-    def run_scheduler(self):
-        """Run the scheduler in a separate thread"""
-        while self.running:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
-    
     def start_service(self):
         """Start the database update service"""
         self.logger.info("Starting Database Update Service")
         
-        # Start scheduler in separate thread
-        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        scheduler_thread.start()
+        # Start scheduled jobs (runs on its own background thread)
+        self.scheduler.start()
         
-        # Keep the service running
+        # Keep the service running until a signal arrives
         try:
-            while self.running:
-                time.sleep(10)
+            self._stop.wait()
         except KeyboardInterrupt:
             pass
     
@@ -493,9 +713,19 @@ class DatabaseUpdateService:
         """Handle shutdown signals"""
         self.logger.info(f"Received signal {signum}, shutting down...")
         self.running = False
+        self._stop.set()
     
     def cleanup(self):
         """Cleanup resources"""
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.flush_asset_scans()
+        with self._write_lock:
+            for conn in self._read_conns + [self._write_conn]:
+                if conn:
+                    conn.close()
+            self._read_conns = []
+            self._write_conn = None
         self.logger.info("Database Update Service cleanup complete")
 
 def main():
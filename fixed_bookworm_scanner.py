@@ -4,10 +4,14 @@ Fixed Bookworm QR Scanner - Addresses silent failure issues
 """
 
 import cv2
+import numpy as np
 import logging
 import time
 import sys
+import queue
+import threading
 from pyzbar import pyzbar
+from pyzbar.locations import Point, Rect
 
 try:
     from picamera2 import Picamera2
@@ -17,7 +21,57 @@ except ImportError as e:
     PICAMERA2_AVAILABLE = False
     print(f"PiCamera2 import failed: {e}")
 
+# Optional: Numba JIT for the contrast/sharpness gate
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def frame_activity(gray):
+        """Grey-level std dev and 4-neighbour Laplacian variance in one pass"""
+        height, width = gray.shape
+        total = 0.0
+        total_sq = 0.0
+        lap_total = 0.0
+        lap_total_sq = 0.0
+        for y in range(height):
+            for x in range(width):
+                value = float(gray[y, x])
+                total += value
+                total_sq += value * value
+                if 0 < y < height - 1 and 0 < x < width - 1:
+                    lap = (4.0 * value - gray[y - 1, x] - gray[y + 1, x]
+                           - gray[y, x - 1] - gray[y, x + 1])
+                    lap_total += lap
+                    lap_total_sq += lap * lap
+        count = height * width
+        mean = total / count
+        lap_count = (height - 2) * (width - 2)
+        lap_mean = lap_total / lap_count
+        return (max(total_sq / count - mean * mean, 0.0) ** 0.5,
+                lap_total_sq / lap_count - lap_mean * lap_mean)
+else:
+    def frame_activity(gray):
+        """Grey-level std dev and Laplacian variance"""
+        _, std_dev = cv2.meanStdDev(gray)
+        return std_dev[0][0], cv2.Laplacian(gray, cv2.CV_64F).var()
+
 class BookwormQRScanner:
+    # Log a status line every this many frames (~10 s at 30 fps)
+    STATUS_EVERY_FRAMES = 300
+    # Frames are checked at this size before decoding; ones with less
+    # contrast (grey-level std dev) or sharpness (Laplacian variance) than
+    # these cannot hold a readable QR code and skip pyzbar
+    GATE_SIZE = (160, 120)
+    CONTRAST_THRESHOLD = 25.0
+    SHARPNESS_THRESHOLD = 50.0
+    # Decode at this size first; go full-res after this many empty frames
+    SCAN_SIZE = (320, 240)
+    FULL_RES_AFTER_MISSES = 5
+    
     def __init__(self):
         """Initialize scanner with proper logging"""
         # Setup logging first
@@ -30,6 +84,17 @@ class BookwormQRScanner:
         
         self.picam2 = None
         self.running = True
+        self._preview = len(sys.argv) > 1 and sys.argv[1] == "--preview"
+        
+        # Newest captured frame only - a slow decode drops frames rather
+        # than falling behind the camera
+        self._frames = queue.Queue(maxsize=1)
+        self._capture_thread = None
+        
+        # Frames skipped by the contrast/sharpness gate vs sent to pyzbar
+        self.gated_frames = 0
+        self.decoded_frames = 0
+        self._miss_count = 0
         
         print("Scanner initialized")
         self.logger.info("BookwormQRScanner initialized")
@@ -59,11 +124,12 @@ class BookwormQRScanner:
                 self.logger.warning(f"Could not get camera info: {info_error}")
                 print("Camera detected but info unavailable")
             
-            # Configure for QR code scanning
+            # Configure for QR code scanning - YUV420 so the luma (Y) plane
+            # can go straight to pyzbar without any colour conversion
             self.logger.info("Configuring camera...")
             config = self.picam2.create_video_configuration({
                 "size": (640, 480),
-                "format": "RGB888"
+                "format": "YUV420"
             })
             
             self.picam2.configure(config)
@@ -79,6 +145,8 @@ class BookwormQRScanner:
             test_frame = self.picam2.capture_array()
             if test_frame is not None and test_frame.size > 0:
                 self.logger.info(f"Camera test successful - Frame shape: {test_frame.shape}")
+                # Compile the frame gate now rather than on the first scanned frame
+                self.worth_decoding(test_frame[:480, :640])
                 print(f"Camera initialized successfully - Frame: {test_frame.shape}")
                 return True
             else:
@@ -100,7 +168,7 @@ class BookwormQRScanner:
             return False
     
     def capture_frame(self):
-        """Capture frame with error handling"""
+        """Capture grayscale (Y plane) frame with error handling"""
         if not self.picam2:
             self.logger.error("Camera not initialized")
             return False, None
@@ -108,9 +176,8 @@ class BookwormQRScanner:
         try:
             frame = self.picam2.capture_array()
             if frame is not None and frame.size > 0:
-                # Convert RGB to BGR for OpenCV
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                return True, frame_bgr
+                # YUV420 - the Y plane is the first 480 rows, already grayscale
+                return True, frame[:480, :640]
             else:
                 self.logger.warning("Captured frame is empty")
                 return False, None
@@ -119,21 +186,49 @@ class BookwormQRScanner:
             self.logger.error(f"Frame capture failed: {e}")
             return False, None
     
+    def worth_decoding(self, frame):
+        """Cheap check on a downscaled copy for enough contrast and focus"""
+        small = cv2.resize(frame, self.GATE_SIZE, interpolation=cv2.INTER_AREA)
+        std_dev, sharpness = frame_activity(small)
+        return std_dev >= self.CONTRAST_THRESHOLD and sharpness >= self.SHARPNESS_THRESHOLD
+    
     def decode_qr_codes(self, frame):
         """Decode QR codes with error handling"""
         try:
             if frame is None:
                 return []
-                
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            
+            # Blank or blurred scenes are rejected before the costly decode
+            if not self.worth_decoding(frame):
+                self.gated_frames += 1
+                return []
+            
+            self.decoded_frames += 1
+            
+            # Search a quarter-size frame first; small or distant codes get a
+            # full-resolution pass once the small frames keep coming up empty
+            width = frame.shape[1]
+            if width > self.SCAN_SIZE[0] and self._miss_count < self.FULL_RES_AFTER_MISSES:
+                gray = cv2.resize(frame, self.SCAN_SIZE, interpolation=cv2.INTER_AREA)
+                scale = width / self.SCAN_SIZE[0]
+            else:
+                gray = frame
+                scale = 1.0
+            
             qr_codes = pyzbar.decode(gray)
             
             if qr_codes:
+                self._miss_count = 0
+                if scale != 1.0:
+                    qr_codes = [self._scale_qr_code(qr, scale) for qr in qr_codes]
                 self.logger.info(f"Found {len(qr_codes)} QR codes")
                 for qr in qr_codes:
                     qr_data = qr.data.decode('utf-8')
                     self.logger.info(f"QR Code detected: '{qr_data}'")
                     print(f"QR Code: {qr_data}")
+            else:
+                # A full-res miss starts the small-frame run over
+                self._miss_count = self._miss_count + 1 if scale != 1.0 else 0
             
             return qr_codes
             
@@ -141,6 +236,31 @@ class BookwormQRScanner:
             self.logger.error(f"QR decode failed: {e}")
             return []
     
+    def _scale_qr_code(self, qr_code, scale):
+        """Map a QR code found on a downscaled frame back to full-frame coordinates"""
+        rect = Rect(*(int(round(value * scale)) for value in qr_code.rect))
+        polygon = [Point(int(round(p.x * scale)), int(round(p.y * scale))) for p in qr_code.polygon]
+        return qr_code._replace(rect=rect, polygon=polygon)
+    
+    def _capture_loop(self):
+        """Capture frames and hand the newest one to the decode loop"""
+        while self.running:
+            ret, frame = self.capture_frame()
+            if not ret or frame is None:
+                self.logger.warning("Failed to capture frame")
+                time.sleep(0.5)
+                continue
+            
+            try:
+                self._frames.put_nowait(frame)
+            except queue.Full:
+                # Drop the stale frame - decode only ever wants the latest
+                try:
+                    self._frames.get_nowait()
+                except queue.Empty:
+                    pass
+                self._frames.put_nowait(frame)
+    
     def run(self):
         """Main loop with comprehensive error handling"""
         self.logger.info("Starting main scanner loop...")
@@ -150,42 +270,41 @@ class BookwormQRScanner:
             print("FATAL: Camera initialization failed")
             return
         
+        # Capture runs on its own thread so decoding never delays the camera
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="capture", daemon=True)
+        self._capture_thread.start()
+        
         frame_count = 0
-        last_status = time.time()
         
         try:
             while self.running:
                 try:
-                    ret, frame = self.capture_frame()
-                    
-                    if not ret or frame is None:
-                        self.logger.warning("Failed to capture frame")
-                        time.sleep(0.5)
+                    try:
+                        frame = self._frames.get(timeout=0.5)
+                    except queue.Empty:
                         continue
                     
                     frame_count += 1
                     
-                    # Status update every 10 seconds
-                    current_time = time.time()
-                    if current_time - last_status > 10:
-                        self.logger.info(f"Scanner running - processed {frame_count} frames")
+                    # Periodic status update
+                    if frame_count % self.STATUS_EVERY_FRAMES == 0:
+                        self.logger.info(f"Scanner running - processed {frame_count} frames "
+                                         f"({self.decoded_frames} decoded, {self.gated_frames} gated)")
                         print(f"Scanner active - {frame_count} frames processed")
-                        last_status = current_time
                     
                     # Decode QR codes
                     qr_codes = self.decode_qr_codes(frame)
                     
                     # Show preview if requested
-                    if len(sys.argv) > 1 and sys.argv[1] == "--preview":
+                    if self._preview:
+                        # Colour copy for display only, so boxes show up green
+                        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
                         for qr_code in qr_codes:
-                            # Draw rectangle around QR code
+                            # Draw outline around QR code
                             points = qr_code.polygon
                             if len(points) == 4:
-                                pts = [(p.x, p.y) for p in points]
-                                pts = [(pts[0], pts[1]), (pts[1], pts[2]), 
-                                      (pts[2], pts[3]), (pts[3], pts[0])]
-                                for i in range(4):
-                                    cv2.line(frame, pts[i][0], pts[i][1], (0, 255, 0), 2)
+                                pts = np.array([(p.x, p.y) for p in points], np.int32).reshape(-1, 1, 2)
+                                cv2.polylines(frame, [pts], True, (0, 255, 0), 2)
                         
                         cv2.imshow('QR Scanner', frame)
                         key = cv2.waitKey(1) & 0xFF
@@ -193,8 +312,6 @@ class BookwormQRScanner:
                             print("Quit key pressed")
                             break
                     
-                    time.sleep(0.1)
-                    
                 except KeyboardInterrupt:
                     self.logger.info("Keyboard interrupt received")
                     print("Stopping scanner...")
@@ -215,6 +332,9 @@ class BookwormQRScanner:
         
         self.running = False
         
+        if self._capture_thread:
+            self._capture_thread.join(timeout=2)
+        
         if self.picam2:
             try:
                 self.picam2.stop()
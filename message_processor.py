@@ -8,6 +8,8 @@ import json
 import pika
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 from datetime import datetime
 from typing import Dict, Any, Optional
@@ -41,6 +43,11 @@ class MessageProcessor:
         )
         self.logger = logging.getLogger(__name__)
         
+        # Keep-alive HTTP sessions, one per backend, so each message reuses
+        # open connections instead of paying a fresh TCP/TLS handshake
+        self._ies4 = self.create_http_session()
+        self._solr = self.create_http_session()
+        
         # Initialize connections
         self.rabbitmq_connection = None
         self.rabbitmq_channel = None
@@ -62,6 +69,19 @@ class MessageProcessor:
             self.logger.error(f"Error parsing configuration file: {e}")
             sys.exit(1)
     
+    def create_http_session(self) -> requests.Session:
+        """Create a pooled HTTP session that retries failed connections"""
+        session = requests.Session()
+        session.headers.update({'User-Agent': 'QR-Scanner-System/1.0'})
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
     def initialize_rabbitmq(self):
         """Initialize RabbitMQ connection"""
         try:
@@ -212,11 +232,10 @@ class MessageProcessor:
             
             headers = {
                 'Content-Type': 'application/json',
-                'Authorization': f"Bearer {ies4_config['api_key']}",
-                'User-Agent': 'QR-Scanner-System/1.0'
+                'Authorization': f"Bearer {ies4_config['api_key']}"
             }
             
-            response = requests.post(
+            response = self._ies4.post(
                 f"{ies4_config['api_endpoint']}/entities/location",
                 json=payload,
                 headers=headers,
@@ -281,9 +300,14 @@ class MessageProcessor:
             
             headers = {'Content-Type': 'application/json'}
             
-            # Send to SOLR
-            response = requests.post(
+            # Send to SOLR - commitWithin lets SOLR batch commits instead of
+            # flushing the index for every message
+            response = self._solr.post(
                 f"{solr_config['base_url']}/{solr_config['collection']}/update/json/docs",
+                params={
+                    'commitWithin': solr_config.get('commit_within_ms', 1000),
+                    'overwrite': 'true'
+                },
                 json=update_data,
                 headers=headers,
                 auth=auth,
@@ -291,21 +315,8 @@ class MessageProcessor:
             )
             
             if response.status_code == 200:
-                # Commit the changes
-                commit_response = requests.post(
-                    f"{solr_config['base_url']}/{solr_config['collection']}/update",
-                    data='{"commit":{}}',
-                    headers=headers,
-                    auth=auth,
-                    timeout=solr_config['timeout']
-                )
-                
-                if commit_response.status_code == 200:
-                    self.logger.info(f"Successfully updated SOLR for {message['object_code']}")
-                    return True
-                else:
-                    self.logger.error(f"SOLR commit failed: {commit_response.status_code}")
-                    return False
+                self.logger.info(f"Successfully updated SOLR for {message['object_code']}")
+                return True
             else:
                 self.logger.error(f"SOLR update failed: {response.status_code} - {response.text}")
                 return False
@@ -367,7 +378,7 @@ class MessageProcessor:
                 'sort': 'last_updated desc'
             }
             
-            response = requests.get(
+            response = self._solr.get(
                 f"{solr_config['base_url']}/{solr_config['collection']}/select",
                 params=params,
                 auth=auth,
@@ -462,6 +473,9 @@ This is an automated notification from the QR Scanner System.
         if self.rabbitmq_connection and not self.rabbitmq_connection.is_closed:
             self.rabbitmq_connection.close()
         
+        self._ies4.close()
+        self._solr.close()
+        
         # Log final statistics
         runtime = datetime.now() - self.processing_stats['start_time']
         self.logger.info(f"Processing Statistics:")